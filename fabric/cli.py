@@ -0,0 +1,28 @@
+'''
+The `fabric` command; each subcommand is a module with a main(argv), imported
+only when it runs.
+
+    fabric status exps_k_all.yml
+'''
+import sys
+from importlib import import_module
+
+SUBCOMMANDS = {
+    'status': ('fabric.cluster.status', 'summarize a sweep from its heartbeats'),
+}
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else list(argv)
+    if len(argv) == 0 or argv[0] in ('-h', '--help') or argv[0] not in SUBCOMMANDS:
+        print("usage: fabric <command> [args]\n\ncommands:")
+        for name, (_, summary) in SUBCOMMANDS.items():
+            print(f"  {name:10s}{summary}")
+        ok = len(argv) > 0 and argv[0] in ('-h', '--help')
+        raise SystemExit(0 if ok else 2)
+    module, _ = SUBCOMMANDS[argv[0]]
+    return import_module(module).main(argv[1:])
+
+
+if __name__ == '__main__':
+    main()
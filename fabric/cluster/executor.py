@@ -0,0 +1,295 @@
+'''
+Where smit's rendered sbatch scripts get run. SlurmExecutor hands them to
+sbatch; LocalExecutor runs them on this machine, as many at once as the local
+GPUs and CPUs allow.
+'''
+from pathlib import Path
+import fcntl
+import json
+import os
+import random
+import re
+import subprocess
+import threading
+import time
+from tempfile import NamedTemporaryFile
+
+SUBMIT_WORKERS = 8
+SUBMIT_RATE = 10  # sbatch calls per second, across the workers
+SUBMIT_RETRIES = 5
+STATE_FNAME = "jobs.json"  # task dir -> slurm job id, inside smit's .smit/ dir
+SCANCEL_CHUNK = 500  # job ids per scancel call; keeps the command line sane
+
+# slurmctld is busy, not wrong; worth another try
+_TRANSIENT_ERRORS = (
+    "Socket timed out", "Unable to contact slurm controller",
+    "Resource temporarily unavailable", "try again",
+)
+
+
+class Executor():
+    def submit(self, script, tasks, array=False):
+        '''
+        script: a rendered sbatch script; tasks: the smit Tasks it covers, in
+        array index order when it is a job array
+        '''
+        raise NotImplementedError()
+
+    def cancel(self, tasks):
+        raise NotImplementedError()
+
+    def finish(self):
+        '''called once everything is submitted; returns the number of failures'''
+        return 0
+
+
+class SlurmExecutor(Executor):
+    '''
+    Submits through a bounded pool of sbatch calls, spaced to at most `rate`
+    per second, retrying transient controller errors with exponential backoff.
+    finish() reports the job ids and failures, and records the job id of every
+    task in the state file.
+    '''
+    def __init__(
+        self, state_dir=None, num_workers=SUBMIT_WORKERS, rate=SUBMIT_RATE,
+        retries=SUBMIT_RETRIES, backoff_secs=1.0
+    ):
+        from concurrent.futures import ThreadPoolExecutor
+        self.state_dir = None if state_dir is None else Path(state_dir)
+        self.pool = ThreadPoolExecutor(max_workers=max(num_workers, 1))
+        self.limiter = RateLimiter(rate)
+        self.retries = retries
+        self.backoff_secs = backoff_secs
+        self.pending = []  # (future, tasks, array)
+
+    def submit(self, script, tasks, array=False):
+        future = self.pool.submit(self._submit_with_retries, script)
+        self.pending.append((future, tasks, array))
+
+    def _submit_with_retries(self, script):
+        for attempt in range(self.retries + 1):
+            self.limiter.wait()
+            try:
+                return sbatch_submit(script)
+            except SbatchError as e:
+                if attempt == self.retries or not e.transient:
+                    raise
+                # 1, 2, 4, ... secs; jittered so the workers don't retry in lockstep
+                time.sleep(self.backoff_secs * 2 ** attempt * random.uniform(0.5, 1.5))
+
+    def finish(self):
+        job_ids, failures = {}, []
+        for future, tasks, array in self.pending:
+            try:
+                job_id = future.result()
+            except Exception as e:
+                failures.append((tasks, e))
+                continue
+            for k, t in enumerate(tasks):
+                # array tasks are addressed as ARRAYID_INDEX
+                job_ids[str(Path(t.path).resolve())] = f"{job_id}_{k}" if array else job_id
+            print(f"submitted {job_id}: {tasks[0].name}" + (
+                f" and {len(tasks) - 1} more" if len(tasks) > 1 else ""
+            ))
+        self.pending = []
+        self.pool.shutdown()
+
+        if self.state_dir is not None and len(job_ids) > 0:
+            update_job_state(self.state_dir, job_ids)
+        print(f"{len(job_ids)} tasks submitted, {sum(len(ts) for ts, _ in failures)} failed")
+        for tasks, e in failures:
+            print(f"  failed: {', '.join(t.name for t in tasks)}: {e}")
+        return len(failures)
+
+    def cancel(self, tasks):
+        '''
+        by the job ids recorded at submission, in a few scancel calls; tasks
+        submitted before smit kept job ids are cancelled by name
+        '''
+        state = {} if self.state_dir is None else read_job_state(self.state_dir)
+        paths = [str(Path(t.path).resolve()) for t in tasks]
+        known = [p for p in paths if p in state]
+        unknown = [t.name for t, p in zip(tasks, paths) if p not in state]
+
+        ids = compress_array_ids([state[p] for p in known], state.values())
+        sbatch_cancel_ids(ids)
+        if len(unknown) > 0:
+            sbatch_cancel_names(unknown)
+        print(f"cancelled {len(known)} tasks by {len(ids)} job ids, {len(unknown)} by name")
+
+
+def compress_array_ids(ids, all_ids):
+    '''
+    ARRAYID_INDEX ids are replaced by the bare ARRAYID when every task the
+    array was submitted with is among them
+    '''
+    def _split(job_id):
+        head, _, index = job_id.partition('_')
+        return head, index
+
+    selected, submitted = {}, {}
+    for job_id in ids:
+        head, index = _split(job_id)
+        selected.setdefault(head, set()).add(index)
+    for job_id in all_ids:
+        head, index = _split(job_id)
+        submitted.setdefault(head, set()).add(index)
+
+    res = []
+    for head, indices in selected.items():
+        if '' in indices or indices >= submitted[head]:
+            res.append(head)
+        else:
+            res.extend(f"{head}_{i}" for i in sorted(indices, key=int))
+    return res
+
+
+class RateLimiter():
+    '''spaces calls at least 1 / rate secs apart, across threads'''
+    def __init__(self, rate):
+        self.interval = 1.0 / rate if rate else 0.0
+        self.lock = threading.Lock()
+        self.next_time = 0.0
+
+    def wait(self):
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_time)
+            self.next_time = slot + self.interval
+        if slot > now:
+            time.sleep(slot - now)
+
+
+class SbatchError(RuntimeError):
+    def __init__(self, msg):
+        super().__init__(msg)
+        self.transient = any(marker in msg for marker in _TRANSIENT_ERRORS)
+
+
+def sbatch_submit(script):
+    '''runs sbatch on the script; returns the job id'''
+    with NamedTemporaryFile(suffix='.sh') as sbatch_file:
+        # slurm copies the named shell script to a private location; a name is needed
+        sbatch_file.file.write(str.encode(script))
+        sbatch_file.file.flush()
+        proc = subprocess.run(
+            ["sbatch", sbatch_file.name], capture_output=True, text=True
+        )
+    if proc.returncode != 0:
+        raise SbatchError(proc.stderr.strip() or f"sbatch exited with {proc.returncode}")
+    match = re.search(r"Submitted batch job (\d+)", proc.stdout)
+    if match is None:
+        raise SbatchError(f"cannot find the job id in sbatch output: {proc.stdout.strip()}")
+    return match.group(1)
+
+
+def read_job_state(state_dir):
+    fname = Path(state_dir) / STATE_FNAME
+    if not fname.is_file():
+        return {}
+    with fname.open("r") as f:
+        return json.load(f)
+
+
+def update_job_state(state_dir, job_ids):
+    '''merge {task dir: job id} into the state file; later submissions win'''
+    Path(state_dir).mkdir(parents=True, exist_ok=True)
+    # concurrent smits on one dir would otherwise drop each other's job ids
+    with open(Path(state_dir) / f"{STATE_FNAME}.lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        state = read_job_state(state_dir)
+        state.update(job_ids)
+        _write_job_state(state_dir, state)
+
+
+def _write_job_state(state_dir, state):
+    fname = Path(state_dir) / STATE_FNAME
+    fname.parent.mkdir(parents=True, exist_ok=True)
+    tmp_fname = fname.with_suffix(".tmp")
+    with tmp_fname.open("w") as f:
+        json.dump(state, f, indent=2, sort_keys=True)
+    os.replace(tmp_fname, fname)
+
+
+class LocalExecutor(Executor):
+    '''
+    Runs each task's sbatch script with bash, once its GPUs and CPUs are free;
+    the #SBATCH lines are comments to bash. Blocks in finish() until all are
+    done; Ctrl-C, or smit -a cancel --backend local from another shell, stops them.
+    '''
+    def __init__(self, num_gpus=None, num_cpus=None, poll_interval=0.5):
+        from .pack_runner import ResourcePool, allocated_gpu_ids
+        self.pool = ResourcePool(
+            allocated_gpu_ids(num_gpus), num_cpus or os.cpu_count()
+        )
+        self.poll_interval = poll_interval
+        self.queue = []
+
+    def submit(self, script, tasks, array=False):
+        from .pack_runner import LocalTask
+        assert not array and len(tasks) == 1, "the local backend runs one script per task"
+        t = tasks[0]
+        # slurm takes -c 0 for 1 cpu
+        self.queue.append(LocalTask(t.path, script, t.args.num_gpus, max(t.args.num_cpus, 1)))
+
+    def cancel(self, tasks):
+        from .pack_runner import cancel_local_tasks
+        n = cancel_local_tasks([t.path for t in tasks])
+        print(f"signalled {n} running tasks; the rest are skipped if still queued")
+
+    def finish(self):
+        from .pack_runner import run_local_tasks, clear_cancel_markers
+        if len(self.queue) == 0:
+            return 0
+        clear_cancel_markers([t.path for t in self.queue])  # stale ones from earlier runs
+        print(f"running {len(self.queue)} tasks locally on {self.pool.total[0]} gpus, "
+              f"{self.pool.total[1]} cpus")
+
+        def _report(event, task):
+            print(f"{event}: {task.path}", flush=True)
+
+        returncodes = run_local_tasks(self.queue, self.pool, self.poll_interval, _report)
+        failed = [p for p, rc in returncodes.items() if rc != 0]
+        print(f"{len(returncodes) - len(failed)} / {len(self.queue)} tasks succeeded")
+        for p in failed:
+            print(f"  failed ({returncodes[p]}): {p}")
+        self.queue = []
+        return len(failed)
+
+
+def make_executor(args, state_dir=None):
+    if args.backend == 'slurm':
+        return SlurmExecutor(
+            state_dir, args.submit_workers, args.submit_rate, args.submit_retries
+        )
+    elif args.backend == 'local':
+        return LocalExecutor(args.local_gpus, args.local_cpus)
+    raise ValueError(f"unknown backend {args.backend}")
+
+
+def sbatch_exec(script):
+    '''submit a single script, without retries; returns the job id'''
+    return sbatch_submit(script)
+
+
+def sbatch_cancel(jname):
+    subprocess.run(f"scancel -n {jname}", shell=True, check=True)
+
+
+def sbatch_cancel_ids(job_ids, chunk=SCANCEL_CHUNK):
+    for i in range(0, len(job_ids), chunk):
+        _scancel(job_ids[i:i + chunk])
+
+
+def sbatch_cancel_names(jnames, chunk=SCANCEL_CHUNK):
+    # scancel takes a comma separated list of names
+    for i in range(0, len(jnames), chunk):
+        _scancel(["-n", ",".join(jnames[i:i + chunk])])
+
+
+def _scancel(argv):
+    # no check; scancel complains about jobs that are already done, and the
+    # rest of them should still go
+    proc = subprocess.run(["scancel"] + list(argv), capture_output=True, text=True)
+    if proc.returncode != 0:
+        print(f"scancel: {proc.stderr.strip()}")
@@ -0,0 +1,248 @@
+'''
+Runs many small tasks inside one allocation. Tasks are launched concurrently
+as long as the allocated GPUs and CPUs last, one process per GPU pinned with
+CUDA_VISIBLE_DEVICES, and the rest wait in a queue. Every task logs to its
+own slurm.out and leaves its exit status in exit_status.json.
+
+smit --pack submits one sbatch per pack that runs
+    python -m fabric.cluster.pack_runner index.txt --job "..."
+and smit --backend local schedules a whole sweep on this machine the same way.
+'''
+from pathlib import Path
+import argparse
+import json
+import os
+import signal
+import subprocess
+import time
+from collections import deque
+from dataclasses import dataclass
+from datetime import datetime
+
+LOG_FNAME = "slurm.out"
+STATUS_FNAME = "exit_status.json"
+PID_FNAME = "task.pid"  # present while the task runs; see cancel_local_tasks
+CANCEL_FNAME = "cancel"  # dropped by cancel_local_tasks before the task started
+
+
+@dataclass
+class LocalTask():
+    path: Path
+    cmd: str  # run with bash inside path
+    num_gpus: int = 0
+    num_cpus: int = 1
+
+
+class ResourcePool():
+    '''
+    GPUs and CPUs handed out as tokens. GPUs are handed out by id, so that each
+    process can be pinned to its own.
+    '''
+    def __init__(self, gpu_ids=(), num_cpus=1):
+        self.free_gpus = list(gpu_ids)
+        self.free_cpus = num_cpus
+        self.total = (len(self.free_gpus), num_cpus)
+
+    def fits(self, num_gpus, num_cpus):
+        '''whether the request can ever be granted, with the whole pool free'''
+        return num_gpus <= self.total[0] and num_cpus <= self.total[1]
+
+    def try_acquire(self, num_gpus, num_cpus):
+        '''the granted gpu ids, or None if the request does not fit right now'''
+        if num_gpus > len(self.free_gpus) or num_cpus > self.free_cpus:
+            return None
+        gpus, self.free_gpus = self.free_gpus[:num_gpus], self.free_gpus[num_gpus:]
+        self.free_cpus -= num_cpus
+        return gpus
+
+    def release(self, gpus, num_cpus):
+        self.free_gpus.extend(gpus)
+        self.free_cpus += num_cpus
+
+
+def run_local_tasks(tasks, pool, poll_interval=0.5, on_event=None):
+    '''
+    Run the tasks as resources free up, in order; a task that would not fit
+    waits rather than letting later ones jump the queue.
+    Returns {task path: returncode}
+    '''
+    for t in tasks:
+        assert pool.fits(t.num_gpus, t.num_cpus), \
+            f"{t.path} asks for {t.num_gpus} gpus, {t.num_cpus} cpus; the pool has {pool.total}"
+
+    pending = deque(tasks)
+    running = {}  # Popen -> (task, gpus, start time)
+    returncodes = {}
+    try:
+        while len(pending) > 0 or len(running) > 0:
+            while len(pending) > 0:
+                t = pending[0]
+                if _pop_cancel_marker(t):
+                    pending.popleft()
+                    returncodes[t.path] = None
+                    _write_status(t, None, [], time.time())
+                    if on_event is not None:
+                        on_event('cancel', t)
+                    continue
+                gpus = pool.try_acquire(t.num_gpus, t.num_cpus)
+                if gpus is None:
+                    break
+                pending.popleft()
+                running[_launch(t, gpus)] = (t, gpus, time.time())
+                if on_event is not None:
+                    on_event('start', t)
+
+            time.sleep(poll_interval)
+            for proc in [p for p in running if p.poll() is not None]:
+                t, gpus, start = running.pop(proc)
+                pool.release(gpus, t.num_cpus)
+                returncodes[t.path] = proc.returncode
+                _write_status(t, proc.returncode, gpus, start)
+                _remove(Path(t.path) / PID_FNAME)
+                if on_event is not None:
+                    on_event('done', t)
+    finally:
+        # cancelled, e.g. scancel's SIGTERM; take the tasks down with us
+        for proc, (t, gpus, start) in running.items():
+            _terminate(proc)
+            _write_status(t, proc.returncode, gpus, start)
+            _remove(Path(t.path) / PID_FNAME)
+    return returncodes
+
+
+def _launch(task, gpus):
+    env = dict(os.environ, IS_REMOTE="1")
+    if len(gpus) > 0 or 'CUDA_VISIBLE_DEVICES' in env:
+        env['CUDA_VISIBLE_DEVICES'] = ','.join(map(str, gpus))
+    path = Path(task.path)
+    with (path / LOG_FNAME).open("a") as log:
+        log.write(
+            f"--------\nLOCAL TASK on {os.uname().nodename}, "
+            f"CUDA_VISIBLE_DEVICES={env.get('CUDA_VISIBLE_DEVICES', '')}\n--------\n"
+        )
+        log.flush()
+        # own session, so that cancelling reaches whatever the task spawns
+        proc = subprocess.Popen(
+            ['bash', '-c', task.cmd], cwd=path, env=env,
+            stdout=log, stderr=subprocess.STDOUT, start_new_session=True
+        )
+    (path / PID_FNAME).write_text(str(proc.pid))
+    return proc
+
+
+def cancel_local_tasks(task_dirs):
+    '''
+    SIGTERM the running ones by their pid files; the ones still queued are
+    marked, and skipped when their turn comes. Returns the number signalled.
+    '''
+    signalled = 0
+    for d in map(Path, task_dirs):
+        try:
+            pid = int((d / PID_FNAME).read_text())
+        except (OSError, ValueError):
+            (d / CANCEL_FNAME).touch()
+            continue
+        try:
+            os.killpg(pid, signal.SIGTERM)  # the task leads its own session
+            signalled += 1
+        except ProcessLookupError:  # finished in the meantime
+            pass
+    return signalled
+
+
+def clear_cancel_markers(task_dirs):
+    for d in map(Path, task_dirs):
+        _remove(d / CANCEL_FNAME)
+
+
+def _pop_cancel_marker(task):
+    marker = Path(task.path) / CANCEL_FNAME
+    if marker.exists():
+        _remove(marker)
+        return True
+    return False
+
+
+def _remove(fname):
+    try:
+        os.remove(fname)
+    except FileNotFoundError:
+        pass
+
+
+def _terminate(proc, grace_secs=10):
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+        proc.wait(timeout=grace_secs)
+    except subprocess.TimeoutExpired:
+        os.killpg(proc.pid, signal.SIGKILL)
+        proc.wait()
+    except ProcessLookupError:
+        proc.wait()
+
+
+def _write_status(task, returncode, gpus, start):
+    status = {
+        "returncode": returncode,
+        "gpus": list(gpus),
+        "started": datetime.fromtimestamp(start).isoformat(timespec='seconds'),
+        "elapsed": int(time.time() - start),
+    }
+    with (Path(task.path) / STATUS_FNAME).open("w") as f:
+        json.dump(status, f)
+
+
+def allocated_gpu_ids(num_gpus=None):
+    '''the ids slurm exposes to the job, else 0..num_gpus-1'''
+    visible = os.environ.get('CUDA_VISIBLE_DEVICES')
+    if visible is not None and num_gpus is None:
+        return [g for g in visible.split(',') if g != '']
+    return [str(i) for i in range(num_gpus or 0)]
+
+
+def allocated_num_cpus(num_cpus=None):
+    if num_cpus is not None:
+        return num_cpus
+    return int(os.environ.get('SLURM_CPUS_PER_TASK', os.cpu_count()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='run the packed tasks of one allocation')
+    parser.add_argument('index', type=str, help='a file listing one task directory per line')
+    parser.add_argument('-j', '--job', type=str, required=True, help='the job command')
+    parser.add_argument('--gpus-per-task', type=int, default=0)
+    parser.add_argument('--cpus-per-task', type=int, default=1)
+    parser.add_argument(
+        '--num-gpus', type=int, default=None,
+        help='gpus to use; defaults to those in CUDA_VISIBLE_DEVICES')
+    parser.add_argument(
+        '--num-cpus', type=int, default=None,
+        help='cpus to use; defaults to SLURM_CPUS_PER_TASK')
+    parser.add_argument('--poll', type=float, default=0.5, help='seconds between polls')
+    args = parser.parse_args()
+
+    with open(args.index, "r") as f:
+        task_dirs = [line.strip() for line in f if line.strip()]
+    tasks = [
+        LocalTask(Path(d), args.job, args.gpus_per_task, args.cpus_per_task)
+        for d in task_dirs
+    ]
+    pool = ResourcePool(allocated_gpu_ids(args.num_gpus), allocated_num_cpus(args.num_cpus))
+
+    def _on_term(signum, frame):
+        raise SystemExit(128 + signum)
+    signal.signal(signal.SIGTERM, _on_term)
+
+    def _report(event, task):
+        print(f"{datetime.now().isoformat(timespec='seconds')} {event} {task.path}", flush=True)
+
+    returncodes = run_local_tasks(tasks, pool, args.poll, on_event=_report)
+    failed = [p for p, rc in returncodes.items() if rc != 0]
+    print(f"{len(returncodes) - len(failed)} / {len(tasks)} tasks succeeded")
+    for p in failed:
+        print(f"  failed: {p}")
+    raise SystemExit(1 if len(failed) > 0 else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,30 @@
+#!/usr/bin/env bash
+
+#SBATCH --job-name={jname}
+#SBATCH --array=0-{last_index}{throttle}
+
+#SBATCH --partition={partition}
+#SBATCH -G {num_gpus}
+#SBATCH -c {num_cpus}
+
+#SBATCH --output={log_fname}
+#SBATCH --open-mode=append
+
+#SBATCH --export=ALL,IS_REMOTE=1
+
+#SBATCH {extra}
+
+# line k + 1 of the index file is the task directory of array task k
+task_dirname=$(sed -n "$((SLURM_ARRAY_TASK_ID + 1))p" "{index_fname}")
+echo $SLURM_ARRAY_JOB_ID-$SLURM_ARRAY_TASK_ID on $SLURMD_NODENAME: $task_dirname
+
+cd "$task_dirname" || exit 1
+# from here on, each task logs to its own slurm.out, like a standalone sbatch
+exec >> slurm.out 2>&1
+
+echo --------
+echo SLURM NODENAME: $SLURMD_NODENAME
+echo SLURM ARRAY TASK: $SLURM_ARRAY_JOB_ID $SLURM_ARRAY_TASK_ID
+echo --------
+
+{job_cmd}
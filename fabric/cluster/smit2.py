@@ -1,13 +1,17 @@
 from pathlib import Path
 import argparse
+import os
 import shlex
+import uuid
 from copy import deepcopy
-import subprocess
+from datetime import datetime
 from pprint import pprint
-from tempfile import NamedTemporaryFile
 from dataclasses import dataclass
 # from .watch import Record, ConnWrapper, open_db
 from .. import dir_of_this_file, yaml_read
+from .executor import make_executor, SUBMIT_WORKERS, SUBMIT_RATE, SUBMIT_RETRIES
+# sbatch_exec and sbatch_cancel used to live here; keep them importable from smit2
+from .executor import sbatch_exec, sbatch_cancel  # noqa: F401
 
 
 @dataclass
@@ -24,30 +28,39 @@ class Record():
     sbatch: str = ""
 
 
+@dataclass
+class Task():
+    name: str
+    path: Path
+    args: argparse.Namespace  # after the config.yml smit overrides
+    unknown: list  # passed on as extra #SBATCH options
+
+
+@dataclass
+class GroupJob():
+    '''one sbatch submission covering many tasks, e.g. a job array or a pack'''
+    name: str
+    sbatch: str
+    index_fname: Path
+    tasks: list
+
+
 VALID_ACTS = ('run', 'cancel')
+VALID_BACKENDS = ('slurm', 'local')
 DEFAULT_PARTITION = 'greg-gpu'
+# slurm's default MaxArraySize is 1001; bigger groups go out as several arrays
+MAX_ARRAY_SIZE = 1000
 
 
-def load_template():
-    template_fname = dir_of_this_file(__file__) / "sbatch_template.sh"
+def load_template(fname="sbatch_template.sh"):
+    template_fname = dir_of_this_file(__file__) / fname
     with template_fname.open("r") as f:
         template = f.read()
     return template
 
 
 template = load_template()
-
-
-def sbatch_exec(script):
-    with NamedTemporaryFile(suffix='.sh') as sbatch_file:
-        # this temp, named buffer is needed. slurm will copy the named shell script
-        # to a private location during execution. a name is needed
-        script = str.encode(script)
-        sbatch_file.file.write(script)
-        sbatch_file.file.seek(0)
-        sbatch_file_name = sbatch_file.name
-        # shell=True is needed; what reason? I can't rmb
-        subprocess.run(f"sbatch {sbatch_file_name}", shell=True, check=True)
+array_template = load_template("sbatch_array_template.sh")
 
 
 def make_record(job_name, task_dirname, args, extra=[]):
@@ -67,6 +80,102 @@ def make_record(job_name, task_dirname, args, extra=[]):
     return entry
 
 
+def resource_key(task):
+    '''tasks that agree on all of these can run off the same sbatch script'''
+    a = task.args
+    return (a.partition, a.num_gpus, a.num_cpus, a.job, tuple(task.unknown))
+
+
+def group_by_resources(tasks):
+    groups = {}
+    for t in tasks:
+        groups.setdefault(resource_key(t), []).append(t)
+    return list(groups.values())
+
+
+def make_array_jobs(tasks, index_dir, throttle=None):
+    '''
+    one job array per group of tasks with identical resources; each array task
+    reads its task directory off line SLURM_ARRAY_TASK_ID + 1 of an index file
+    '''
+    index_dir = Path(index_dir)
+    stamp = _index_stamp()
+    throttle = "" if throttle is None else f"%{throttle}"
+
+    arrays = []
+    for group in group_by_resources(tasks):
+        for i in range(0, len(group), MAX_ARRAY_SIZE):
+            chunk = group[i:i + MAX_ARRAY_SIZE]
+            fname_stem = f"{stamp}_{len(arrays)}"
+            index_fname = index_dir / f"{fname_stem}.txt"
+
+            prefix = os.path.commonprefix([t.name for t in chunk]).rstrip('_/')
+            jname = f"{prefix or 'smit'}.arr{len(arrays)}"
+
+            a = chunk[0].args
+            script = array_template.format(
+                jname=jname, last_index=len(chunk) - 1, throttle=throttle,
+                partition=a.partition, num_gpus=a.num_gpus, num_cpus=a.num_cpus,
+                log_fname=str(index_dir / f"{fname_stem}.out"),
+                index_fname=str(index_fname),
+                job_cmd=a.job, extra=' '.join(chunk[0].unknown)
+            )
+            arrays.append(GroupJob(jname, script, index_fname, chunk))
+    return arrays
+
+
+def _index_stamp():
+    '''
+    unique per smit invocation: sweeps launched from one dir share .smit/, and
+    a pending task reads its index file only once it starts
+    '''
+    return f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:8]}"
+
+
+def make_pack_jobs(tasks, index_dir, pack_size, slots=None):
+    '''
+    pack_size tasks with identical resources per allocation, of which `slots`
+    (all by default) run at once under fabric.cluster.pack_runner; the
+    allocation asks for the resources of one task times the slots
+    '''
+    index_dir = Path(index_dir)
+    stamp = _index_stamp()
+
+    packs = []
+    for group in group_by_resources(tasks):
+        for i in range(0, len(group), pack_size):
+            chunk = group[i:i + pack_size]
+            fname_stem = f"{stamp}_pack{len(packs)}"
+            index_fname = index_dir / f"{fname_stem}.txt"
+
+            prefix = os.path.commonprefix([t.name for t in chunk]).rstrip('_/')
+            jname = f"{prefix or 'smit'}.pack{len(packs)}"
+
+            a = chunk[0].args
+            num_slots = min(slots or len(chunk), len(chunk))
+            cpus_per_task = max(a.num_cpus, 1)
+            runner_cmd = (
+                f"python -m fabric.cluster.pack_runner {shlex.quote(str(index_fname))}"
+                f" --job {shlex.quote(a.job)}"
+                f" --gpus-per-task {a.num_gpus} --cpus-per-task {cpus_per_task}"
+            )
+            script = template.format(
+                jname=jname, partition=a.partition,
+                num_gpus=a.num_gpus * num_slots, num_cpus=cpus_per_task * num_slots,
+                task_dirname=str(index_dir), log_fname=str(index_dir / f"{fname_stem}.out"),
+                job_cmd=runner_cmd, extra=' '.join(chunk[0].unknown)
+            )
+            packs.append(GroupJob(jname, script, index_fname, chunk))
+    return packs
+
+
+def write_index(group_job):
+    group_job.index_fname.parent.mkdir(parents=True, exist_ok=True)
+    with group_job.index_fname.open("w") as f:
+        # must be abspaths; the tasks start in slurm's working directory
+        f.write("".join(f"{t.path.resolve()}\n" for t in group_job.tasks))
+
+
 def infer_job_names(task_dirs, nj: int):
     assert len(task_dirs) > 0
 
@@ -126,6 +235,39 @@ def make_parser():
     parser.add_argument(
         '-m', '--mock', default=False, action='store_true',
         help='in mock mode the slurm command is printed but not executed')
+    parser.add_argument(
+        '--array', default=False, action='store_true',
+        help='submit tasks with identical resources as one slurm job array')
+    parser.add_argument(
+        '--throttle', type=int, default=None,
+        help='with --array, at most this many tasks of an array run at once')
+    parser.add_argument(
+        '--backend', default='slurm', choices=VALID_BACKENDS,
+        help='slurm, or local to run the tasks on this machine')
+    parser.add_argument(
+        '--local-gpus', type=int, default=None,
+        help='with --backend local, gpus to use; default those in CUDA_VISIBLE_DEVICES')
+    parser.add_argument(
+        '--local-cpus', type=int, default=None,
+        help='with --backend local, cpus to use; default all')
+    parser.add_argument(
+        '--submit-workers', type=int, default=SUBMIT_WORKERS,
+        help='concurrent sbatch calls')
+    parser.add_argument(
+        '--submit-rate', type=float, default=SUBMIT_RATE,
+        help='at most this many sbatch calls per second')
+    parser.add_argument(
+        '--submit-retries', type=int, default=SUBMIT_RETRIES,
+        help='retries of an sbatch call failing on e.g. Socket timed out')
+    parser.add_argument(
+        '--track', default=False, action='store_true',
+        help='register the submitted jobs with the local tracker; see tracker.survey')
+    parser.add_argument(
+        '--pack', type=int, default=None,
+        help='run this many tasks with identical resources inside one allocation')
+    parser.add_argument(
+        '--slots', type=int, default=None,
+        help='with --pack, how many of the packed tasks run at once; default all')
     # parser.add_argument(
     #     '--nodb', default=False, action='store_true',
     #     help='do not register jobs to database')
@@ -153,7 +295,11 @@ def main():
     xor = (args.file is not None) ^ (args.dir is not None)
     if not xor:
         raise ValueError("exactly one of [--file] or [--dir] is required for smit")
-    task_dir_list = yaml_read(args.file) if args.file else [args.dir]
+    task_dir_list = (yaml_read(args.file) or []) if args.file else [args.dir]
+    if len(task_dir_list) == 0:
+        # e.g. the exps_{k}.yml of a re-sow that changed nothing
+        print(f"no task dirs in {args.file}; nothing to submit")
+        return
 
     job_names = infer_job_names(task_dir_list, args.nj)
 
@@ -165,29 +311,48 @@ def main():
             f"action must be one of {VALID_ACTS}, but given: {args.action}"
         )
 
-    records = []
-    for i in range(len(task_dir_list)):
-        task_dir = Path(task_dir_list[i])
-        assert task_dir.is_dir()
+    tasks = collect_tasks(task_dir_list, job_names, args, unknown, parser_no_default)
+    # index files and job ids sit with the sweep's exps_{k}.yml; the tasks must be able to read them
+    smit_dir = (Path(args.file).resolve().parent if args.file else Path.cwd()) / ".smit"
+    executor = make_executor(args, smit_dir)
 
-        curr_args, curr_unknown = args, unknown
+    if args.action == "cancel" and not args.mock:
+        executor.cancel(tasks)
+        return
 
-        # load the config.yml and read smit specific cmd
-        # override what is in the args
-        cfg_fname = task_dir / "config.yml"
-        if cfg_fname.is_file():
-            # jargs: job_specific_args
-            jargs = shlex.split(
-                yaml_read(cfg_fname).get("smit", "")
-            )
-            if len(jargs) > 0:
-                # CANNOT use the vanilla parser. Defaults will erroneously override the global args.
-                curr_args, curr_unknown = merge_job_specific_args(
-                    parser_no_default, curr_args, curr_unknown, jargs
-                )
+    if (args.array or args.pack) and args.action == "run":
+        assert args.backend == 'slurm', "the local backend already runs the tasks side by side"
+        assert not (args.array and args.pack), "--array and --pack are exclusive"
+        if args.array:
+            group_jobs = make_array_jobs(tasks, smit_dir, args.throttle)
+        else:
+            assert args.pack > 0
+            group_jobs = make_pack_jobs(tasks, smit_dir, args.pack, args.slots)
+        for i, group_job in enumerate(group_jobs):
+            if args.mock:
+                print(f"------ {i}, {group_job.name}: {len(group_job.tasks)} tasks")
+                print(group_job.sbatch)
+                print("------\n")
+                continue
+            write_index(group_job)
+            executor.submit(group_job.sbatch, group_job.tasks, array=args.array)
+        kind = "job arrays" if args.array else "packs"
+        print(f"{len(tasks)} tasks in {len(group_jobs)} {kind}")
+        num_failed = executor.finish()
+        if args.track and not args.mock:
+            track_records([
+                Record(name=t.name, todo=0, path=str(t.path), sbatch=group_job.sbatch)
+                for group_job in group_jobs for t in group_job.tasks
+            ])
+        if num_failed > 0:
+            raise SystemExit(1)
+        return
 
+    records = []
+    for i, task in enumerate(tasks):
+        curr_args, curr_unknown = task.args, task.unknown
         entry = make_record(
-            job_names[i], task_dir, curr_args, curr_unknown
+            task.name, task.path, curr_args, curr_unknown
         )
 
         if args.mock:
@@ -204,13 +369,15 @@ def main():
             print("------\n")
             continue
 
-        if args.action == "run":
-            sbatch_exec(entry.sbatch)
-        elif args.action == "cancel":
-            sbatch_cancel(entry.name)
-
+        executor.submit(entry.sbatch, [task])
         records.append(entry)
 
+    num_failed = executor.finish()
+    if args.track and len(records) > 0:
+        track_records(records)
+    if num_failed > 0:
+        raise SystemExit(1)
+
     # if not args.mock and not args.nodb:
     # if False:
     #     with open_db() as conn:
@@ -223,6 +390,40 @@ def main():
     #         conn.commit()
 
 
+def track_records(records):
+    from .tracker import LocalTracker
+    with LocalTracker() as tracker:
+        tracker.insert(records)
+        tracker.commit()
+    print(f"tracking {len(records)} jobs")
+
+
+def collect_tasks(task_dir_list, job_names, args, unknown, parser_no_default):
+    tasks = []
+    for job_name, task_dir in zip(job_names, task_dir_list):
+        task_dir = Path(task_dir)
+        assert task_dir.is_dir()
+
+        curr_args, curr_unknown = args, unknown
+
+        # load the config.yml and read smit specific cmd
+        # override what is in the args
+        cfg_fname = task_dir / "config.yml"
+        if cfg_fname.is_file():
+            # jargs: job_specific_args
+            jargs = shlex.split(
+                yaml_read(cfg_fname).get("smit", "")
+            )
+            if len(jargs) > 0:
+                # CANNOT use the vanilla parser. Defaults will erroneously override the global args.
+                curr_args, curr_unknown = merge_job_specific_args(
+                    parser_no_default, curr_args, curr_unknown, jargs
+                )
+
+        tasks.append(Task(job_name, task_dir, curr_args, curr_unknown))
+    return tasks
+
+
 def merge_job_specific_args(
     parser_no_default, curr_args, curr_unknown,
     job_specific_args: list
@@ -249,10 +450,6 @@ def merge_job_specific_args(
     return curr_args, extra_unknown
 
 
-def sbatch_cancel(jname):
-    subprocess.run(f"scancel -n {jname}", shell=True, check=True)
-
-
 # # deprecated
 # def period_watch(interval):
 #     from time import sleep
@@ -0,0 +1,189 @@
+'''
+The status of a sweep at a glance, from the heartbeat.json of every run listed
+in an exps_{key}_all.yml. Heartbeats are read by a thread pool, and on refresh only
+those whose mtime or size changed are read again, so that a sweep of thousands
+of runs on NFS stays cheap to watch.
+
+    fabric status exps_k_all.yml
+    fabric status exps_k_all.yml --watch 30 --stall 900
+'''
+from pathlib import Path
+import argparse
+import os
+import re
+import time
+from datetime import datetime, timedelta
+from termcolor import colored
+
+from .. import yaml_read
+from .tracker import HeartbeatReader
+from .smit2 import infer_job_names
+
+RUNNING = 'running'
+STALLED = 'stalled'
+DONE = 'done'
+NOT_STARTED = 'not started'
+# the order of the table; the ones needing attention first
+STATUSES = (STALLED, RUNNING, NOT_STARTED, DONE)
+_STATUS_COLORS = {RUNNING: 'green', STALLED: 'red', DONE: 'blue', NOT_STARTED: 'yellow'}
+
+# the tqdm meter as written by the heartbeat, e.g. "5/10 [00:03<00:03,  1.50it/s]"
+_METER_RE = re.compile(r'^\s*(?P<progress>\S+)\s*\[(?P<elapsed>[^<\]]*)<(?P<eta>[^,\]]*)')
+
+
+def parse_meter(meter):
+    '''returns (progress, eta); either is None when the meter does not say'''
+    m = _METER_RE.match(meter or "")
+    if m is None:
+        return None, None
+    eta = m.group('eta').strip()
+    return m.group('progress'), (eta if eta not in ('', '?') else None)
+
+
+def classify(info, now, stall_secs):
+    '''info: a parsed heartbeat, or None when the run has not written one yet'''
+    if info is None:
+        return NOT_STARTED
+    if info.get('done', False):
+        return DONE
+    try:
+        beat = datetime.fromisoformat(info['beat'])
+    except (KeyError, TypeError, ValueError):
+        return STALLED
+    return STALLED if (now - beat).total_seconds() > stall_secs else RUNNING
+
+
+class SweepStatus():
+    '''the runs of one exps_{key}_all.yml; refresh() re-reads what changed'''
+    def __init__(self, exps_fname, num_workers=None):
+        self.exps_fname = Path(exps_fname)
+        self.reader = HeartbeatReader() if num_workers is None else HeartbeatReader(num_workers)
+        self.exps_key = None
+        self.run_dirs = []
+        self.names = []
+        self.beats = {}  # heartbeat fname -> last parsed heartbeat
+
+    def refresh(self):
+        '''returns [(run name, heartbeat or None)]; names are the run dirs past their common prefix'''
+        st = os.stat(self.exps_fname)
+        if (st.st_mtime_ns, st.st_size) != self.exps_key:
+            # re-sown; the runs may have changed
+            self.exps_key = (st.st_mtime_ns, st.st_size)
+            self.run_dirs = [Path(d) for d in (yaml_read(self.exps_fname) or [])]
+            self.names = infer_job_names(self.run_dirs, None) if len(self.run_dirs) > 0 else []
+            kept = set(str(d / "heartbeat.json") for d in self.run_dirs)
+            dropped = [fname for fname in self.beats if fname not in kept]
+            for fname in dropped:
+                del self.beats[fname]
+            self.reader.forget(dropped)
+        fnames = [str(d / "heartbeat.json") for d in self.run_dirs]
+        for fname, info in self.reader.read_changed(fnames).items():
+            if info is None:  # the heartbeat was deleted, e.g. the run is restarting
+                self.beats.pop(fname, None)
+            else:
+                self.beats[fname] = info
+        return [(name, self.beats.get(fname)) for name, fname in zip(self.names, fnames)]
+
+
+def status_rows(runs, now, stall_secs):
+    rows = []
+    for name, info in runs:
+        status = classify(info, now, stall_secs)
+        info = info or {}
+        progress, eta = parse_meter(info.get('meter'))
+        if status != RUNNING:
+            eta = None
+        rows.append({
+            'run': name,
+            'status': status,
+            'progress': progress,
+            'elapsed': info.get('elapsed'),
+            'eta': eta,
+            'beat': info.get('beat'),
+        })
+    order = {s: i for i, s in enumerate(STATUSES)}
+    rows.sort(key=lambda r: (order[r['status']], r['run']))
+    return rows
+
+
+def format_status_table(rows, now, show=STATUSES, color=True):
+    def age(beat):
+        try:
+            secs = (now - datetime.fromisoformat(beat)).total_seconds()
+        except (TypeError, ValueError):
+            return '-'
+        return _format_secs(max(secs, 0)) + ' ago'
+
+    header = ['run', 'status', 'progress', 'elapsed', 'eta', 'last beat']
+    cells = [
+        [
+            r['run'], r['status'], r['progress'] or '-',
+            _format_secs(r['elapsed']) if r['elapsed'] is not None else '-',
+            r['eta'] or '-', age(r['beat'])
+        ]
+        for r in rows if r['status'] in show
+    ]
+    widths = [len(h) for h in header]
+    for row in cells:
+        widths = [max(w, len(c)) for w, c in zip(widths, row)]
+
+    def line(row, status=None):
+        text = '  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip()
+        if color and status is not None:
+            text = colored(text, _STATUS_COLORS[status])
+        return text
+
+    lines = [line(header), '  '.join('-' * w for w in widths)]
+    lines.extend(line(row, row[1]) for row in cells)
+    counts = {s: 0 for s in STATUSES}
+    for r in rows:
+        counts[r['status']] += 1
+    lines.append(
+        f"{len(rows)} runs: " + ', '.join(f"{counts[s]} {s}" for s in STATUSES)
+    )
+    return '\n'.join(lines)
+
+
+def _format_secs(secs):
+    return str(timedelta(seconds=int(secs)))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='fabric status', description='summarize a sweep from the heartbeats of its runs'
+    )
+    parser.add_argument('exps', type=str, help='the exps_{key}_all.yml written by sow; exps_{key}.yml covers only the last sow')
+    parser.add_argument(
+        '--stall', type=float, default=600,
+        help='seconds without a beat before a running job counts as stalled')
+    parser.add_argument(
+        '--show', type=str, default=','.join(STATUSES),
+        help=f'comma separated statuses to list; the counts always cover all. From {STATUSES}')
+    parser.add_argument(
+        '--watch', type=float, default=None, metavar='SECS',
+        help='refresh every SECS seconds; only changed heartbeats are re-read')
+    parser.add_argument('--workers', type=int, default=None, help='heartbeat reader threads')
+    args = parser.parse_args(argv)
+
+    show = tuple(s.strip() for s in args.show.split(','))
+    for s in show:
+        assert s in STATUSES, f"unknown status {s}; choose from {STATUSES}"
+
+    sweep = SweepStatus(args.exps, args.workers)
+    while True:
+        start = time.time()
+        runs = sweep.refresh()
+        now = datetime.now()
+        table = format_status_table(status_rows(runs, now, args.stall), now, show)
+        if args.watch is None:
+            print(table)
+            return
+        # clear the screen and redraw in place
+        print("\033[H\033[J" + table)
+        print(f"{now.isoformat(timespec='seconds')}, read in {time.time() - start:.2f}s; "
+              f"refreshing every {args.watch:g}s", flush=True)
+        time.sleep(args.watch)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,177 @@
+'''
+A local job tracker: the jobs and done tables of watch.py, kept in a sqlite
+file rather than on a Postgres server. A survey pass stats every running job's
+heartbeat.json, reads only those that changed since the last pass, and writes
+all the updates in one transaction.
+'''
+from pathlib import Path
+import json
+import os
+import sqlite3
+import time
+from dataclasses import fields
+from .smit2 import Record
+
+_DB_ENV_VAR = 'FABRIC_TRACKER_DB'
+_DEFAULT_DB_FNAME = '~/.cache/fabric/tracker.sqlite'
+_READ_WORKERS = 16  # heartbeats sit on NFS; the pool hides the latency
+
+_SQL_TYPES = {str: "TEXT", int: "INTEGER", bool: "INTEGER"}
+RECORD_FIELDS = [f.name for f in fields(Record)]
+# the fields a heartbeat may update
+HEARTBEAT_FIELDS = ('meter', 'beat', 'caller', 'done', 'elapsed')
+_GONE = object()  # a heartbeat that was read before and has been deleted since
+
+
+def default_db_fname():
+    return os.path.expanduser(os.environ.get(_DB_ENV_VAR, _DEFAULT_DB_FNAME))
+
+
+def open_local_db(fname=None):
+    fname = default_db_fname() if fname is None else fname
+    Path(fname).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(fname, timeout=30, check_same_thread=False)
+    # readers, e.g. a status page, never block the surveyor and vice versa
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for table in ("jobs", "done"):
+        # a job is running at most once; it may finish many times
+        columns = ", ".join(
+            f'"{f.name}" {_SQL_TYPES[f.type]}'
+            + (" UNIQUE NOT NULL" if f.name == "name" and table == "jobs" else "")
+            for f in fields(Record)
+        )
+        conn.execute(f'CREATE TABLE IF NOT EXISTS "{table}" (id INTEGER PRIMARY KEY, {columns})')
+    conn.commit()
+    return conn
+
+
+class HeartbeatReader():
+    '''
+    Remembers the (mtime, size) of every heartbeat it read, and only reads
+    the files that changed since.
+    '''
+    def __init__(self, num_workers=_READ_WORKERS):
+        self.num_workers = num_workers
+        self.seen = {}  # fname -> (mtime_ns, size)
+
+    def read_changed(self, fnames):
+        '''
+        returns {fname: parsed heartbeat} for the new or changed files, and
+        {fname: None} for those read before that are gone now
+        '''
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(max_workers=self.num_workers) as pool:
+            results = list(pool.map(self._read_if_changed, fnames))
+        return {
+            fname: (None if info is _GONE else info)
+            for fname, info in zip(fnames, results) if info is not None
+        }
+
+    def _read_if_changed(self, fname):
+        try:
+            st = os.stat(fname)
+        except FileNotFoundError:
+            return _GONE if self.seen.pop(fname, None) is not None else None
+        key = (st.st_mtime_ns, st.st_size)
+        if self.seen.get(fname) == key:
+            return None
+        try:
+            with open(fname, "r") as f:
+                info = json.load(f)
+        except (OSError, ValueError):
+            # concurrent NFS read-write might cause erroneous input
+            # just wait till next round
+            return None
+        self.seen[fname] = key
+        return info
+
+    def forget(self, fnames):
+        for fname in fnames:
+            self.seen.pop(fname, None)
+
+
+class LocalTracker():
+    '''
+    The same calls as watch.ConnWrapper, on the local sqlite db, plus sweep()
+    for one survey pass. Records are smit2.Record; the writes go through the
+    ConnWrapper bulk calls.
+    '''
+    def __init__(self, fname=None, conn=None):
+        from .watch import ConnWrapper  # watch pulls in pydantic; only the tracker needs it
+        self.conn = open_local_db(fname) if conn is None else conn
+        self.db = ConnWrapper(self.conn)
+        self.reader = HeartbeatReader()
+
+    def get_all_jobs(self, dbname="jobs"):
+        cols = ", ".join(f'"{k}"' for k in RECORD_FIELDS)
+        rows = self.conn.execute(f'SELECT {cols} FROM "{dbname}"').fetchall()
+        return [Record(**dict(zip(RECORD_FIELDS, row))) for row in rows]
+
+    def insert(self, records, dbname="jobs"):
+        if dbname == "jobs":
+            # re-submitting a job replaces its row instead of failing on the name
+            self.db.upsert_many(records, dbname, key="name")
+        else:
+            self.db.insert_many(records, dbname)
+
+    def update(self, name, field, new_val):
+        assert field in RECORD_FIELDS, f"unknown field {field}"
+        self.db.update_many([(name, {field: new_val})])
+
+    def drop_row(self, name):
+        self.db.delete_many([name])
+
+    def commit(self):
+        return self.db.commit()
+
+    def sweep(self):
+        '''
+        one survey pass; returns the number of jobs whose heartbeat changed
+        and the number that finished
+        '''
+        records = self.get_all_jobs()
+        fnames = [str(Path(r.path) / "heartbeat.json") for r in records]
+        changed = self.reader.read_changed(fnames)
+
+        updates, finished = [], []
+        for r, fname in zip(records, fnames):
+            info = changed.get(fname)
+            if info is None:
+                continue
+            info = {k: info[k] for k in HEARTBEAT_FIELDS if k in info}
+            for k, v in info.items():
+                setattr(r, k, v)
+            updates.append((r.name, {k: getattr(r, k) for k in HEARTBEAT_FIELDS}))
+            if r.done:
+                finished.append(r)
+
+        with self.conn:  # one transaction for the whole pass
+            self.db.update_many(updates)
+            self.db.insert_many(finished, "done")
+            self.db.delete_many([r.name for r in finished])
+        self.reader.forget(str(Path(r.path) / "heartbeat.json") for r in finished)
+        return len(updates), len(finished)
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def survey(interval=5, fname=None):
+    from tqdm import tqdm
+
+    with LocalTracker(fname) as tracker:
+        pbar = tqdm()
+        while True:
+            start = time.time()
+            num_changed, num_finished = tracker.sweep()
+            pbar.set_postfix(changed=num_changed, finished=num_finished,
+                             secs=f"{time.time() - start:.2f}")
+            pbar.update()
+            time.sleep(interval)
@@ -34,53 +34,127 @@ class ConnWrapper():
     """
     these are just some pythonic shortcuts
     sql itself is inconvenient
+
+    Works over a psycopg or a sqlite3 connection. The bulk calls send all rows
+    in one executemany; nothing is committed until commit().
     """
     def __init__(self, conn):
         self.conn = conn
+        self.is_sqlite = type(conn).__module__.startswith("sqlite3")
+        # psycopg takes %s placeholders and the tables sit in the public schema
+        self.mark = "?" if self.is_sqlite else "%s"
+        self.schema = None if self.is_sqlite else "public"
 
     def get_all_jobs(self):
-        with self.conn.cursor() as cur:
-            cur.execute("SELECT * FROM jobs")
-            res = cur.fetchall()
+        res = self._fetchall(f"SELECT * FROM {self._table('jobs')}")
         records = bind_records(res)
         return records
 
     def insert(self, records, dbname="jobs"):
-        with self.conn.cursor() as cur:
-            for row in records:
-                data = row.dict()
-                keys = tuple(data.keys())
-                key_fields = str(keys).replace('\'', "\"")  # terrible
-                vals = list(data.values())
-                template = f"""
-                    INSERT INTO "public"."{dbname}"
-                    {key_fields}
-                    VALUES
-                    ({("%s, " * len(vals))[:-2]});
-                """  # -2 is a terrible hack to remove the last comma... I don't like sql
-                cur.execute(template, vals)
+        self.insert_many(records, dbname)
 
     def update(self, name, field, new_val):
-        with self.conn.cursor() as cur:
-            cur.execute(
-                f"""
-                UPDATE "public"."jobs" SET "{field}" = %s WHERE "name" = %s;
-                """,
-                [new_val, name]
-            )
+        self.update_many([(name, {field: new_val})])
 
     def drop_row(self, name):
-        with self.conn.cursor() as cur:
-            cur.execute(
-                """
-                DELETE FROM "public"."jobs" WHERE "name" = %s;
-                """,
-                [name]
+        self.delete_many([name])
+
+    def insert_many(self, records, dbname="jobs"):
+        rows = [_as_dict(r) for r in records]
+        if len(rows) == 0:
+            return
+        keys = list(rows[0].keys())
+        self._executemany(
+            f"INSERT INTO {self._table(dbname)} ({self._columns(keys)}) "
+            f"VALUES ({', '.join([self.mark] * len(keys))})",
+            [[row[k] for k in keys] for row in rows]
+        )
+
+    def upsert_many(self, records, dbname="jobs", key="name"):
+        '''insert, or overwrite the row with the same key; the key column must be unique'''
+        rows = [_as_dict(r) for r in records]
+        if len(rows) == 0:
+            return
+        keys = list(rows[0].keys())
+        assignments = ", ".join(
+            f"{quote_ident(k)} = excluded.{quote_ident(k)}" for k in keys if k != key
+        )
+        self._executemany(
+            f"INSERT INTO {self._table(dbname)} ({self._columns(keys)}) "
+            f"VALUES ({', '.join([self.mark] * len(keys))}) "
+            f"ON CONFLICT ({quote_ident(key)}) DO UPDATE SET {assignments}",
+            [[row[k] for k in keys] for row in rows]
+        )
+
+    def update_many(self, updates, dbname="jobs", key="name"):
+        '''
+        updates: a list of (key value, {field: new value}). Rows setting the
+        same fields go out in one executemany.
+        '''
+        groups = {}
+        for name, changes in updates:
+            fields = tuple(changes.keys())
+            groups.setdefault(fields, []).append(
+                [changes[f] for f in fields] + [name]
             )
+        for fields, params in groups.items():
+            if len(fields) == 0:
+                continue
+            assignments = ", ".join(f"{quote_ident(f)} = {self.mark}" for f in fields)
+            self._executemany(
+                f"UPDATE {self._table(dbname)} SET {assignments} "
+                f"WHERE {quote_ident(key)} = {self.mark}",
+                params
+            )
+
+    def delete_many(self, names, dbname="jobs", key="name"):
+        self._executemany(
+            f"DELETE FROM {self._table(dbname)} WHERE {quote_ident(key)} = {self.mark}",
+            [[name] for name in names]
+        )
 
     def commit(self):
         return self.conn.commit()
 
+    def _table(self, dbname):
+        if self.schema is None:
+            return quote_ident(dbname)
+        return f"{quote_ident(self.schema)}.{quote_ident(dbname)}"
+
+    def _columns(self, keys):
+        return ", ".join(quote_ident(k) for k in keys)
+
+    def _fetchall(self, query, params=()):
+        cur = self.conn.cursor()
+        try:
+            cur.execute(query, params)
+            return cur.fetchall()
+        finally:
+            cur.close()
+
+    def _executemany(self, query, params):
+        if len(params) == 0:
+            return
+        cur = self.conn.cursor()
+        try:
+            cur.executemany(query, params)
+        finally:
+            cur.close()
+
+
+def quote_ident(name):
+    '''an sql identifier, quoted; embedded quotes are doubled'''
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _as_dict(record):
+    if isinstance(record, dict):
+        return record
+    if hasattr(record, "dict"):  # pydantic
+        return record.dict()
+    from dataclasses import asdict
+    return asdict(record)
+
 
 def bind_records(jobs):
     # ugly sql hack
@@ -94,7 +168,12 @@ def bind_records(jobs):
     return records
 
 
-def survey(interval=5):
+def survey(interval=5, backend="postgres"):
+    if backend == "sqlite":
+        from .tracker import survey as local_survey
+        return local_survey(interval)
+    assert backend == "postgres", f"unknown backend {backend}"
+
     from time import sleep
     from datetime import timedelta
     from tqdm import tqdm
@@ -106,11 +185,11 @@ def survey(interval=5):
             pbar.update()
 
             records = conn.get_all_jobs()
+            updates, finished = [], []
             for r in records:
                 jname = r.name
                 if r.done:
-                    conn.drop_row(jname)
-                    conn.insert([r], "done")
+                    finished.append(r)
                     continue
 
                 hbeat = Path(r.path) / "heartbeat.json"
@@ -124,11 +203,14 @@ def survey(interval=5):
                         print(str(e))
                         continue
 
-                    for k in info.keys():
-                        conn.update(jname, k, info[k])
+                    updates.append((jname, info))
 
                     # if timedelta(seconds=info['elapsed']) > timedelta(hours=3, minutes=50):
                     #     conn.update(jname, "todo", 1)
 
+            # the whole pass in one transaction, a few statements regardless of the job count
+            conn.update_many(updates)
+            conn.insert_many(finished, "done")
+            conn.delete_many([r.name for r in finished])
             conn.commit()
             sleep(interval)
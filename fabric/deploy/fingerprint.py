@@ -0,0 +1,174 @@
+'''
+Content addressed fingerprints of experiment configs, and a local index from
+fingerprint to a completed run directory, so that identical configs planted in
+different runs folders need not be trained twice.
+'''
+import os
+import os.path as osp
+import argparse
+import json
+import hashlib
+import sqlite3
+import time
+from termcolor import cprint
+
+# launcher options; they decide where a run goes, not what it computes
+_IGNORED_KEYS = ('smit', )
+
+_INDEX_ENV_VAR = 'FABRIC_RESULT_INDEX'
+_DEFAULT_INDEX_FNAME = '~/.cache/fabric/results.sqlite'
+
+
+def config_fingerprint(cfg, schema=None, ignore=_IGNORED_KEYS):
+    '''
+    sha256 over a canonical serialization of the config; key order, tuple vs
+    list, and the launcher fields in `ignore` do not matter.
+    Args:
+        cfg: a dict, or anything with an as_dict() e.g. BaseConfig, FrozenConfig
+        schema: optionally a BaseConfig subclass used to fill in the defaults,
+            so that a field set to its default and an omitted field agree
+    '''
+    if schema is not None and isinstance(cfg, dict):
+        cfg = {k: v for k, v in cfg.items() if k not in ignore}
+        cfg = schema(cfg)
+    if hasattr(cfg, 'as_dict'):
+        cfg = cfg.as_dict()
+    assert isinstance(cfg, dict), f"cannot fingerprint a {type(cfg).__name__}"
+    cfg = {k: v for k, v in cfg.items() if k not in ignore}
+    payload = json.dumps(
+        _canonical(cfg), sort_keys=True, separators=(',', ':'), ensure_ascii=True
+    )
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def _canonical(node):
+    if isinstance(node, dict):
+        return {str(k): _canonical(v) for k, v in node.items()}
+    if isinstance(node, (list, tuple)):
+        return [_canonical(v) for v in node]
+    return node
+
+
+def run_is_completed(run_dir):
+    '''a run is completed once its heartbeat says so'''
+    fname = osp.join(run_dir, 'heartbeat.json')
+    try:
+        with open(fname, 'r') as f:
+            return bool(json.load(f).get('done', False))
+    except (OSError, ValueError):
+        return False
+
+
+def default_index_fname():
+    return osp.expanduser(os.environ.get(_INDEX_ENV_VAR, _DEFAULT_INDEX_FNAME))
+
+
+class ResultIndex():
+    '''
+    fingerprint -> completed run directory, in a local sqlite file.
+    Entries whose run directory is gone or no longer completed are dropped on
+    lookup.
+    '''
+    def __init__(self, fname=None):
+        self.fname = default_index_fname() if fname is None else fname
+        dirname = osp.dirname(osp.abspath(self.fname))
+        os.makedirs(dirname, exist_ok=True)
+        self.conn = sqlite3.connect(self.fname, timeout=30)
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS results (
+                fingerprint TEXT PRIMARY KEY,
+                run_dir TEXT NOT NULL,
+                registered REAL NOT NULL
+            )
+        """)
+        self.conn.commit()
+
+    def lookup(self, fingerprint):
+        return self.lookup_many([fingerprint]).get(fingerprint)
+
+    def lookup_many(self, fingerprints):
+        '''returns {fingerprint: run_dir} for those with a completed run'''
+        fingerprints = list(set(fingerprints))
+        found = {}
+        chunk = 500  # stay under sqlite's limit on bound parameters
+        for i in range(0, len(fingerprints), chunk):
+            part = fingerprints[i:i + chunk]
+            rows = self.conn.execute(
+                f"SELECT fingerprint, run_dir FROM results "
+                f"WHERE fingerprint IN ({', '.join('?' * len(part))})", part
+            ).fetchall()
+            found.update(rows)
+
+        stale = [fp for fp, run_dir in found.items() if not run_is_completed(run_dir)]
+        if len(stale) > 0:
+            self.conn.executemany(
+                "DELETE FROM results WHERE fingerprint = ?", [(fp, ) for fp in stale]
+            )
+            self.conn.commit()
+        return {fp: run_dir for fp, run_dir in found.items() if fp not in stale}
+
+    def register(self, fingerprint, run_dir):
+        self.register_many([(fingerprint, run_dir)])
+
+    def register_many(self, pairs):
+        '''pairs of (fingerprint, run_dir); a later registration wins'''
+        now = time.time()
+        self.conn.executemany(
+            "INSERT OR REPLACE INTO results (fingerprint, run_dir, registered) "
+            "VALUES (?, ?, ?)",
+            [(fp, osp.abspath(run_dir), now) for fp, run_dir in pairs]
+        )
+        self.conn.commit()
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM results").fetchone()[0]
+
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def find_completed_runs(root_dirs):
+    '''yields (fingerprint, run_dir) for every completed run under root_dirs'''
+    from fabric import yaml_read
+    for root in root_dirs:
+        for dirpath, dirnames, fnames in os.walk(root):
+            if 'config.yml' not in fnames or 'heartbeat.json' not in fnames:
+                continue
+            if not run_is_completed(dirpath):
+                continue
+            cfg = yaml_read(osp.join(dirpath, 'config.yml'))
+            if isinstance(cfg, dict):
+                yield config_fingerprint(cfg), dirpath
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description='register completed runs in the result index used by sow --dedup'
+    )
+    parser.add_argument(
+        'dirs', nargs='*', default=['.'],
+        help='directories searched recursively for completed runs'
+    )
+    parser.add_argument(
+        '--index', type=str, default=None,
+        help=f'the index file; defaults to ${_INDEX_ENV_VAR} or {_DEFAULT_INDEX_FNAME}'
+    )
+    args = parser.parse_args()
+
+    with ResultIndex(args.index) as index:
+        found = list(find_completed_runs(args.dirs))
+        index.register_many(found)
+        cprint(
+            f"registered {len(found)} completed runs; {len(index)} in {index.fname}",
+            color='blue'
+        )
+
+
+if __name__ == '__main__':
+    main()
@@ -1,16 +1,21 @@
 import os
 import os.path as osp
 import argparse
-from copy import deepcopy
-from collections import namedtuple
+import ast
+import hashlib
+import json
+from collections import Counter, namedtuple
+from copy import copy, deepcopy
+from functools import lru_cache
 import yaml
 from termcolor import cprint
-from .. import yaml_read
 
 # '_' prefix so that it is sorted to the top when dumping yaml
 _INFO_COLOR = 'blue'
 _WARN_COLOR = 'red'
 
+_PLANT_WORKERS = 16
+
 
 _LAUNCH_FIELDS_SPEC = {
     'required': ['particular'],
@@ -31,7 +36,7 @@ for _field_spec in (_LAUNCH_FIELDS_SPEC, _PARTICULAR_FIELDS_SPEC):
 
 def join_parts_into_path(parts, nest_at):
     if nest_at is None:
-        return '_'.join(parts)
+        return '_'.join(map(str, parts))  # aliases need not be str
     else:
         assert isinstance(nest_at, int) and nest_at >= 0
         nest_at += 1  # skip the initial lead name
@@ -84,19 +89,47 @@ def main():
         '-m', '--mock', nargs='*', type=str, required=False,
         help='specify a list of configs to be printed in full details'
     )
+    parser.add_argument(
+        '-w', '--workers', type=int, default=_PLANT_WORKERS,
+        help='number of threads planting configs; mostly waiting on (NFS) file I/O'
+    )
+    parser.add_argument(
+        '--show_removed', action='store_true',
+        help='list the exps planted by a previous sow that are no longer in the launch file'
+    )
+    parser.add_argument(
+        '--dedup', type=str, default='off', choices=['off', 'skip', 'symlink'],
+        help='for exps whose config already completed elsewhere (see reap), '
+             'skip them or symlink to the completed run instead of planting'
+    )
+    parser.add_argument(
+        '--index', type=str, default=None,
+        help='the result index used by --dedup; defaults to that of reap'
+    )
+    parser.add_argument(
+        '--diff', action='store_true',
+        help='dry run; print for each exp only the options that differ from the base'
+    )
+    parser.add_argument(
+        '--diff_json', type=str, default=None,
+        help='dry run; write the per exp diffs from the base as json to this file, - for stdout'
+    )
     args = parser.parse_args()
 
     LAUNCH_FNAME = args.file
     LAUNCH_DIR_ABSPATH = os.getcwd()
     RUN_DIR_NAME = f"runs_{args.key}"
     SOW_LOG_FNAME = osp.join(LAUNCH_DIR_ABSPATH, f"exps_{args.key}.yml")
+    ALL_LOG_FNAME = osp.join(LAUNCH_DIR_ABSPATH, f"exps_{args.key}_all.yml")
+    MANIFEST_FNAME = osp.join(LAUNCH_DIR_ABSPATH, f"exps_{args.key}_manifest.json")
     launch_config = yaml_read(LAUNCH_FNAME)
 
     # parse the config
     # chdir first. cfg import might assume relpath from template file
     # this statement must come after reading launch_cfg
     os.chdir(osp.dirname(osp.abspath(LAUNCH_FNAME)))
-    cfg_name_2_maker = parse_launch_config(launch_config)
+    base_maker = make_base_maker(launch_config)
+    cfg_name_2_maker = parse_launch_config(launch_config, base_maker)
     cfg_name_2_maker = {
         join_parts_into_path(k, args.nest_at): v
         for k, v in cfg_name_2_maker.items()
@@ -113,6 +146,18 @@ def main():
             print(_yaml_dump(maker.state))
         return
 
+    # if diffing, summarize how each exp departs from the base and quit
+    if args.diff or args.diff_json is not None:
+        base, diffs = diff_exps(base_maker.state, cfg_name_2_maker)
+        if args.diff_json == '-':
+            print(json.dumps({'base': base, 'exps': diffs}, default=str))
+        else:
+            print(format_diff_table(base, diffs))
+            if args.diff_json is not None:
+                with open(args.diff_json, 'w') as f:
+                    json.dump({'base': base, 'exps': diffs}, f, indent=2, default=str)
+        return
+
     # sow the cfgs
 
     # 1. create the runs folder, chdir, and plant configs inside
@@ -121,36 +166,48 @@ def main():
         print(f"making {RUN_DIR_NAME} inside launch")
     os.chdir(RUN_DIR_NAME)
 
-    sow_acc = []
-    for i, (exp_name, maker) in enumerate(cfg_name_2_maker.items()):
-        cprint("sowing {}: {}".format(i, exp_name), color=_INFO_COLOR)
-        _paths = plant_cfg(exp_name, maker.state, overwrite=args.overwrite, repeat=args.repeat)
-        sow_acc.extend([osp.abspath(e) for e in _paths])
-
-    # 2. save a log file for other utils to use
-    with open(SOW_LOG_FNAME, 'w') as f:
-        pl = _yaml_dump(sow_acc)
-        f.write(pl)
+    cprint(f"sowing {len(cfg_name_2_maker)} exps", color=_INFO_COLOR)
+    manifest = read_manifest(MANIFEST_FNAME)
+    exps = [(exp_name, maker.state) for exp_name, maker in cfg_name_2_maker.items()]
+    deduped = []
+    if args.dedup != 'off':
+        assert args.repeat == 0, "repeats share a config by design; cannot dedup them"
+        exps, deduped = dedup_completed(exps, args.dedup, args.index)
+    _paths, statuses = plant_cfgs(
+        exps,
+        overwrite=args.overwrite, repeat=args.repeat, num_workers=args.workers,
+        manifest=manifest
+    )
+    statuses.extend(dedup_statuses(deduped, manifest))
+    print_plant_summary(statuses)
+    print_removed(removed_from_manifest(manifest, statuses), args.show_removed)
+    write_manifest(MANIFEST_FNAME, manifest_of(statuses))
+
+    # 2. save log files for other utils to use
+    # exps_{k}.yml lists the exps written just now, for smit to submit;
+    # exps_{k}_all.yml every exp whose config on disk matches the launch file,
+    # e.g. for fabric status
+    sow_acc = [osp.abspath(path) for path in _paths]
+    all_acc = [osp.abspath(path) for path in current_paths(statuses)]
+    for fname, acc in ((SOW_LOG_FNAME, sow_acc), (ALL_LOG_FNAME, all_acc)):
+        with open(fname, 'w') as f:
+            f.write(_yaml_dump(acc))
+    cprint(f"{osp.basename(SOW_LOG_FNAME)}: the {len(sow_acc)} exps to submit", color=_INFO_COLOR)
+    cprint(
+        f"{osp.basename(ALL_LOG_FNAME)}: all {len(all_acc)} exps; use it for "
+        f"fabric status and smit -a cancel", color=_INFO_COLOR
+    )
 
 
-def parse_launch_config(launch_config):
+def parse_launch_config(launch_config, base_maker=None):
+    '''
+    Returns {name parts: ConfigMaker}. The makers share the untouched subtrees
+    of base_maker, made from launch_config when not given.
+    '''
     validate_dict_fields(launch_config, _LAUNCH_FIELDS_SPEC)
-
     acc = {}
-    # construct base config through import or from 'base'
-    if 'import_base' in launch_config:
-        assert 'base' not in launch_config, \
-            'using imported base config; do not supply base config'
-        import_path = launch_config['import_base']
-        base_maker = ConfigMaker(yaml_read(import_path))
-    else:
-        base_maker = ConfigMaker(launch_config['base'])
-
-    # execute base modifications
-    if 'base_modify' in launch_config:
-        clauses = launch_config['base_modify']
-        for _clau in clauses:
-            base_maker.execute_clause(_clau)
+    if base_maker is None:
+        base_maker = make_base_maker(launch_config)
 
     # execute particular configs
     for part in launch_config['particular']:
@@ -176,6 +233,102 @@ def parse_launch_config(launch_config):
     return acc
 
 
+def make_base_maker(launch_config):
+    '''the base config every exp starts from, with base_modify applied'''
+    validate_dict_fields(launch_config, _LAUNCH_FIELDS_SPEC)
+    # construct base config through import or from 'base'
+    if 'import_base' in launch_config:
+        assert 'base' not in launch_config, \
+            'using imported base config; do not supply base config'
+        import_path = launch_config['import_base']
+        base_maker = ConfigMaker(yaml_read(import_path))
+    else:
+        base_maker = ConfigMaker(launch_config['base'])
+
+    # execute base modifications
+    if 'base_modify' in launch_config:
+        clauses = launch_config['base_modify']
+        for _clau in clauses:
+            base_maker.execute_clause(_clau)
+    return base_maker
+
+
+_UNSET = '<unset>'  # how a key absent on one side of a diff is displayed
+_MISSING = object()
+
+
+def diff_from_base(base, node, prefix=''):
+    '''
+    {dotted key: value in node} for every leaf where node departs from base.
+    Sweep points share their untouched subtrees with the base, so those are
+    skipped by identity without being walked.
+    '''
+    acc = {}
+    _diff_into(acc, base, node, prefix)
+    return acc
+
+
+def _diff_into(acc, base, node, prefix):
+    if node is base:
+        return
+    if isinstance(base, dict) and isinstance(node, dict):
+        for k, v in node.items():
+            _diff_into(acc, base.get(k, _MISSING), v, f"{prefix}{k}.")
+        for k in base.keys():
+            if k not in node:
+                acc[f"{prefix}{k}"] = _UNSET
+        return
+    if base is _MISSING or base != node or type(base) != type(node):
+        acc[prefix[:-1]] = node
+
+
+def diff_exps(base_state, name_2_maker):
+    '''
+    Returns the base values of all the keys that vary, and
+    {exp name: {dotted key: value}} of each exp's departures from the base
+    '''
+    diffs = {
+        name: diff_from_base(base_state, maker.state)
+        for name, maker in name_2_maker.items()
+    }
+    keys = {}  # ordered set, in the order keys are first seen
+    for d in diffs.values():
+        keys.update(dict.fromkeys(d))
+    base = {k: _lookup_dotted(base_state, k) for k in keys}
+    return base, diffs
+
+
+def _lookup_dotted(node, dotted_key):
+    for part in dotted_key.split('.'):
+        if not isinstance(node, dict) or part not in node:
+            return _UNSET
+        node = node[part]
+    return node
+
+
+def format_diff_table(base, diffs, max_width=24):
+    '''one row per exp, one column per varying key; '.' where an exp keeps the base value'''
+    def cell(val):
+        text = val if isinstance(val, str) else json.dumps(val, default=str)
+        return text if len(text) <= max_width else text[:max_width - 3] + '...'
+
+    header = ['exp'] + list(base.keys())
+    rows = [['<base>'] + [cell(v) for v in base.values()]]
+    for name, d in diffs.items():
+        rows.append([name] + [cell(d[k]) if k in d else '.' for k in base.keys()])
+
+    widths = [len(h) for h in header]
+    for row in rows:
+        widths = [max(w, len(c)) for w, c in zip(widths, row)]
+    lines = [
+        '  '.join(c.ljust(w) for c, w in zip(row, widths)).rstrip()
+        for row in [header] + rows
+    ]
+    lines.insert(1, '  '.join('-' * w for w in widths))
+    lines.append(f"{len(diffs)} exps; {len(base)} options vary")
+    return '\n'.join(lines)
+
+
 def validate_dict_fields(src_dict, field_spec):
     assert isinstance(src_dict, dict)
     # check required fields are present
@@ -270,10 +423,19 @@ class ConfigMaker():
 
     def __init__(self, base_node):
         self.state = base_node
-        self.clauses = []
+        self.clauses = []  # the override set applied on top of base_node
 
     def clone(self):
-        return deepcopy(self)
+        '''
+        O(1); the clone shares the config tree with self. Clauses never mutate
+        a node in place but copy the containers along their path (see
+        NodeTracer), so shared subtrees stay valid for every maker holding them.
+        A sweep point thus costs its overrides, not a full copy of the base.
+        '''
+        other = self.__class__.__new__(self.__class__)
+        other.state = self.state
+        other.clauses = list(self.clauses)
+        return other
 
     def execute_clause(self, raw_clause):
         cls = self.__class__
@@ -289,7 +451,7 @@ class ConfigMaker():
             cmd = raw_clause
             arg = None
         cmd = self.parse_clause_cmd(cmd)
-        tracer = NodeTracer(self.state)
+        tracer = NodeTracer(self.state, copy_on_write=True)
         tracer.advance_pointer(path=cmd.sub)
         if cmd.verb == cls.VERBS[0]:
             tracer.add(cmd.objs, arg)
@@ -299,8 +461,10 @@ class ConfigMaker():
             assert isinstance(raw_clause, str)
             tracer.delete(cmd.objs)
         self.state = tracer.state
+        self.clauses.append(raw_clause)
 
     @classmethod
+    @lru_cache(maxsize=None)  # sweeps repeat the same few clause strings many times
     def parse_clause_cmd(cls, input):
         """
         Args:
@@ -360,11 +524,15 @@ class ConfigMaker():
 
 
 class NodeTracer():
-    def __init__(self, src_node):
+    def __init__(self, src_node, copy_on_write=False):
         """
         A src node can be either a list or dict
+        With copy_on_write, every container on the traced path is shallow-copied
+        before being descended into, so edits land on fresh copies and the src
+        tree, possibly shared with other configs, is left untouched.
         """
         assert isinstance(src_node, (list, dict))
+        self.copy_on_write = copy_on_write
 
         # these are movable pointers
         self.child_token = "_"  # init token can be anything
@@ -385,12 +553,14 @@ class NodeTracer():
     def advance_pointer(self, path):
         if len(path) == 0:
             return
-        path_list = list(
-            map(lambda x: int(x) if str.isdigit(x) else x, path.split('.'))
-        )
+        path_list = _split_path(path)
 
         for i, token in enumerate(path_list):
-            self.parent = self.pointed
+            node = self.pointed
+            if self.copy_on_write and isinstance(node, (list, dict)):
+                node = copy(node)
+                self.parent[self.child_token] = node
+            self.parent = node
             self.child_token = token
             try:
                 self.pointed
@@ -442,19 +612,7 @@ class NodeTracer():
         #         raise ValueError("{} is not a container node".format(self.pointed))
 
         assert len(objs) == 0
-        val_type = type(self.parent[self.child_token])
-        # this is such an unfortunate hack
-        # turn everything to string, so that eval could work
-        # some of the clauses come from cmdline, some from yaml files for sow.
-        arg = str(arg)
-        if val_type == str:
-            pass
-        else:
-            arg = eval(arg)
-            assert type(arg) == val_type, \
-                f"require {val_type.__name__}, given {type(arg).__name__}"
-
-        self.parent[self.child_token] = arg
+        self.parent[self.child_token] = typed_override(self.parent[self.child_token], arg)
 
     # def delete(self, objs):
     #     if isinstance(self.pointed, list):
@@ -467,59 +625,317 @@ class NodeTracer():
     #         del self.pointed[field]
 
 
+@lru_cache(maxsize=None)
+def _split_path(path):
+    return tuple(int(x) if str.isdigit(x) else x for x in path.split('.'))
+
+
+def typed_override(curr, arg):
+    '''
+    The value to replace curr with. Clauses from sow yamls arrive as native
+    yaml values; those from the cmdline arrive as str and are parsed back into
+    a value unless the field itself is a str. The result must keep the type of
+    the node it replaces; None on either side (unset) is always accepted.
+    '''
+    if isinstance(curr, str):
+        return str(arg) if arg is not None else None
+    if isinstance(arg, str):
+        arg = parse_literal(arg)
+    if curr is not None and arg is not None:
+        assert type(arg) == type(curr), \
+            f"require {type(curr).__name__}, given {type(arg).__name__}"
+    return arg
+
+
+def parse_literal(text):
+    '''
+    python literals first ('True', '1e-3', "['a', 1]"), then yaml scalars and
+    flow collections ('true', 'null', '{a: 1}'); anything else stays a str.
+    Nothing is ever evaluated as code.
+    '''
+    val = _parse_literal(text)
+    # the cache hands out the same object every time; containers must not be shared
+    return deepcopy(val) if isinstance(val, (list, dict)) else val
+
+
+@lru_cache(maxsize=4096)
+def _parse_literal(text):
+    try:
+        return ast.literal_eval(text.strip())
+    except (ValueError, SyntaxError, TypeError, MemoryError, RecursionError):
+        pass
+    try:
+        return _yaml_load(text)
+    except yaml.YAMLError:
+        return text
+
+
+_PLANTED = 'planted'
+_UNCHANGED = 'unchanged'
+_DUP_IDENTICAL = 'dup identical'
+_DUP_DIFFERS = 'dup differs'
+_DEDUPED = 'completed elsewhere'
+
+
 def plant_cfg(expname, cfg_node, overwrite, repeat):
     '''plant the config
     Args:
         launch_dir: abspath! of launch directory from which run.py is copied
         exp_name: the bare name of experiment folder in which things are dumped
     '''
+    paths, _ = plant_cfgs([(expname, cfg_node)], overwrite, repeat, num_workers=1)
+    return paths
 
-    def _write_cfg(_path, payload):
-        assert str(_path)[-3:] == 'yml'
-        with open(_path, 'w') as f:
-            pl = _yaml_dump(payload)
-            f.write(pl)
 
-    def _do_plant(exp_name):
-        cfg_fname = osp.join(exp_name, 'config.yml')
+def plant_cfgs(exps, overwrite, repeat, num_workers=_PLANT_WORKERS, manifest=None):
+    '''
+    Plant many configs concurrently; the work is dominated by file I/O latency.
+    Args:
+        exps: a list of (exp_name, cfg_node)
+        manifest: {path: config hash} of a previous sow; exps whose hash is
+            unchanged are not touched at all
+    Returns:
+        the paths written to, in the order of exps, and a list of
+        (path, status, written, hash of the config on disk) for every
+        candidate path; the hash is None when unknown
+    '''
+    from concurrent.futures import ThreadPoolExecutor  # only needed when planting
+    manifest = {} if manifest is None else manifest
+    jobs = []
+    for exp_name, cfg_node in exps:
+        if repeat == 0:
+            jobs.append((exp_name, cfg_node))
+        else:
+            assert repeat > 0
+            jobs.extend(
+                (osp.join(exp_name, f"{i:0>2}"), cfg_node) for i in range(repeat)
+            )
 
-        if osp.isdir(exp_name):  # duplicate exists
-            # 1. compare whether the options are identical
-            old_cfg = yaml_read(cfg_fname)
+    def _plant(job):
+        path, cfg_node = job
+        return _plant_one(path, cfg_node, overwrite, manifest.get(path))
+
+    with ThreadPoolExecutor(max_workers=max(num_workers, 1)) as pool:
+        statuses = list(pool.map(_plant, jobs))
+        planted = [path for (path, _, written, _) in statuses if written]
+        # flush only what was written, once all of it is: the config files,
+        # their dirs, and every dir that gained a new entry; each dir only once
+        dirs = set(planted)
+        for (path, status, _, _) in statuses:
+            while status == _PLANTED and path not in ('', '.'):
+                path = osp.dirname(path)
+                dirs.add(path or '.')
+        to_sync = [osp.join(path, 'config.yml') for path in planted] + sorted(dirs)
+        list(pool.map(_fsync_path, to_sync))
+    return planted, statuses
+
+
+def _plant_one(exp_name, cfg_node, overwrite, known_hash=None):
+    '''returns (exp_name, status, whether config.yml was written, hash on disk)'''
+    if osp.islink(exp_name):
+        # linked to a completed run by --dedup symlink; never plant into that run
+        return exp_name, _DEDUPED, False, known_hash
+
+    cfg_fname = osp.join(exp_name, 'config.yml')
+    payload = _yaml_dump(cfg_node).encode('utf-8')
+    digest = content_hash(payload)
+
+    if known_hash == digest and osp.isfile(cfg_fname):
+        return exp_name, _UNCHANGED, False, digest
+
+    try:
+        os.makedirs(exp_name, exist_ok=False)
+    except FileExistsError:  # duplicate exists
+        if _same_cfg_on_disk(cfg_fname, payload, cfg_node):
+            return exp_name, _DUP_IDENTICAL, False, digest  # nothing to rewrite
+        if overwrite:
+            _write_bytes(cfg_fname, payload)
+            return exp_name, _DUP_DIFFERS, True, digest
+        return exp_name, _DUP_DIFFERS, False, known_hash
+
+    _write_bytes(cfg_fname, payload)
+    return exp_name, _PLANTED, True, digest
+
+
+def dedup_completed(exps, mode, index_fname=None):
+    '''
+    drop the exps whose config already completed in another run directory;
+    with mode 'symlink', the exp path is linked to that run.
+    Returns the remaining exps, and (exp_name, completed run dir) of the dropped
+    '''
+    from .fingerprint import config_fingerprint, ResultIndex
+    fingerprints = [config_fingerprint(cfg_node) for (_, cfg_node) in exps]
+    with ResultIndex(index_fname) as index:
+        completed = index.lookup_many(fingerprints)
+
+    remaining, deduped, not_linked = [], [], []
+    for (exp_name, cfg_node), fp in zip(exps, fingerprints):
+        run_dir = completed.get(fp)
+        if run_dir is None or osp.realpath(run_dir) == osp.realpath(exp_name):
+            remaining.append((exp_name, cfg_node))
+            continue
+        if mode == 'symlink':
+            if osp.lexists(exp_name):
+                # e.g. the dir of an earlier, unfinished plant; it is planted as usual
+                not_linked.append((exp_name, run_dir))
+                remaining.append((exp_name, cfg_node))
+                continue
+            parent = osp.dirname(exp_name)
+            if parent:
+                os.makedirs(parent, exist_ok=True)
+            os.symlink(run_dir, exp_name, target_is_directory=True)
+        deduped.append((exp_name, run_dir))
+
+    if len(deduped) > 0:
+        verb = 'linked' if mode == 'symlink' else 'skipped'
+        cprint(f"{len(deduped)} exps already completed elsewhere; {verb}:", color=_INFO_COLOR)
+        for exp_name, run_dir in deduped:
+            print(f"  {exp_name} -> {run_dir}")
+    if len(not_linked) > 0:
+        cprint(
+            f"{len(not_linked)} exps completed elsewhere already exist here; not linked:",
+            color=_WARN_COLOR
+        )
+        for exp_name, run_dir in not_linked:
+            print(f"  {exp_name} (completed in {run_dir})")
+    return remaining, deduped
 
-            if old_cfg == cfg_node:
-                print("dup identical", end='; ')
-            else:
-                cprint("dup differs: {}".format(exp_name), color=_WARN_COLOR, end='; ')
 
-            if overwrite:
-                print("overwriting")
-                _write_cfg(cfg_fname, cfg_node)
-                return [exp_name]
-            else:
-                print("skipping")
-                return []
+def dedup_statuses(deduped, manifest):
+    '''
+    statuses for the exps dedup_completed dropped; they are still in the launch
+    file, so they keep their manifest entry and are not reported as removed
+    '''
+    return [(exp_name, _DEDUPED, False, manifest.get(exp_name)) for exp_name, _ in deduped]
 
-        else:
-            os.makedirs(exp_name, exist_ok=False)
-            _write_cfg(cfg_fname, cfg_node)
-            return [exp_name]
 
-    if repeat == 0:
-        return _do_plant(expname)
-    else:
-        assert repeat > 0
-        os.makedirs(expname, exist_ok=True)
-        _planted_paths = []
-        for i in range(repeat):
-            _planted_paths.extend(_do_plant(
-                osp.join(expname, f"{i:0>2}")
-            ))
-        return _planted_paths
+def _same_cfg_on_disk(cfg_fname, payload, cfg_node):
+    if not osp.isfile(cfg_fname):
+        return False
+    with open(cfg_fname, 'rb') as f:
+        existing = f.read()
+    # configs written by sow are byte-identical when identical; only parse
+    # when the hashes differ, e.g. for a config formatted by hand
+    if content_hash(existing) == content_hash(payload):
+        return True
+    return _yaml_load(existing) == cfg_node
+
+
+def _write_bytes(fname, payload):
+    '''write the file; plant_cfgs flushes all it wrote in one pass at the end'''
+    assert str(fname)[-3:] == 'yml'
+    with open(fname, 'wb') as f:
+        f.write(payload)
+
+
+def _fsync_path(fname):
+    '''fsync a file or a dir; for a dir this makes its new entries durable'''
+    try:
+        fd = os.open(fname, os.O_RDONLY)
+    except OSError:  # e.g. windows cannot open a directory
+        return
+    try:
+        os.fsync(fd)
+    except OSError:  # some file systems refuse to fsync a directory
+        pass
+    finally:
+        os.close(fd)
+
+
+def content_hash(payload):
+    if isinstance(payload, str):
+        payload = payload.encode('utf-8')
+    return hashlib.sha256(payload).hexdigest()
+
+
+def current_paths(statuses):
+    '''paths whose config on disk now matches the launch file; deduped exps have none'''
+    return [
+        path for (path, status, written, _) in statuses
+        if status != _DEDUPED and (status != _DUP_DIFFERS or written)
+    ]
+
+
+def manifest_of(statuses):
+    return {path: digest for (path, _, _, digest) in statuses if digest is not None}
+
+
+def removed_from_manifest(manifest, statuses):
+    current = set(path for (path, *_) in statuses)
+    return sorted(path for path in manifest if path not in current)
+
+
+def read_manifest(fname):
+    if not osp.isfile(fname):
+        return {}
+    with open(fname, 'r') as f:
+        return json.load(f)
+
+
+def write_manifest(fname, manifest):
+    # write aside and rename, so an interrupted sow never leaves half a manifest
+    tmp_fname = f"{fname}.tmp"
+    with open(tmp_fname, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(tmp_fname, fname)
+
+
+def print_plant_summary(statuses):
+    counts = Counter((status, written) for (_, status, written, _) in statuses)
+    differing = [
+        path for (path, status, written, _) in statuses
+        if status == _DUP_DIFFERS and not written
+    ]
+
+    print(f"planted {counts[(_PLANTED, True)]} new configs")
+    if counts[(_UNCHANGED, False)] > 0:
+        print(f"{_UNCHANGED}: {counts[(_UNCHANGED, False)]} untouched")
+    if counts[(_DEDUPED, False)] > 0:
+        print(f"{_DEDUPED}: {counts[(_DEDUPED, False)]} not planted")
+    for status in (_DUP_IDENTICAL, _DUP_DIFFERS):
+        for written, verb in ((True, 'overwritten'), (False, 'skipped')):
+            if counts[(status, written)] > 0:
+                print(f"{status}: {counts[(status, written)]} {verb}")
+    if len(differing) > 0:
+        cprint("dups that differ from the configs on disk; --overwrite to replace:", color=_WARN_COLOR)
+        for path in differing:
+            cprint(f"  {path}", color=_WARN_COLOR)
+
+
+def print_removed(removed, show=False):
+    if len(removed) == 0:
+        return
+    cprint(f"{len(removed)} exps of the last sow are no longer in the launch file", color=_WARN_COLOR)
+    if show:
+        for path in removed:
+            cprint(f"  {path}", color=_WARN_COLOR)
+
+
+# the C implementations when pyyaml is built against libyaml
+_SafeLoader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+_SafeDumper = getattr(yaml, 'CSafeDumper', yaml.SafeDumper)
+
+
+class _NoAliasDumper(_SafeDumper):
+    # sweep points share subtrees; never emit them as yaml anchors / aliases
+    def ignore_aliases(self, data):
+        return True
+
+
+def yaml_read(fname):
+    with open(fname, 'r') as f:
+        return _yaml_load(f)
+
+
+def _yaml_load(stream):
+    return yaml.load(stream, Loader=_SafeLoader)
 
 
 def _yaml_dump(state):
-    return yaml.safe_dump(state, sort_keys=False, allow_unicode=True, default_flow_style=False)
+    return yaml.dump(
+        state, Dumper=_NoAliasDumper,
+        sort_keys=False, allow_unicode=True, default_flow_style=False
+    )
 
 
 if __name__ == '__main__':
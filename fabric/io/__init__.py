@@ -1,6 +1,32 @@
+import importlib
 import os.path as osp
 import pickle
 
+# resolved on first access (PEP 562); the submodules pull in av, soundfile,
+# PIL and lmdb, which most importers of fabric.io never touch
+_LAZY_ATTRS = {
+    'load_audio': '.audio',
+    'AudioReader': '.audio',
+    'stream_audio': '.audio',
+    'Video': '.video',
+    'dump_key_frames_to_lmdb': '.video',
+    'save_to_lmdb': '.lmdb_tools',
+    'LMDBData': '.lmdb_tools',
+    'ImageLMDB': '.lmdb_tools',
+}
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    val = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    globals()[name] = val  # later lookups skip __getattr__
+    return val
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(_LAZY_ATTRS.keys()))
+
 
 def save_object(obj, file_name):
     """Save a Python object by pickling it."""
@@ -1,20 +1,34 @@
-import soundfile as sf
-import torchaudio as ta
+import os
+import queue
+import struct
+import threading
+from collections import namedtuple, OrderedDict
+from functools import lru_cache
+import numpy as np
 from .common import check_start_end_time
 
-__all__ = ['load_audio']
+__all__ = ['load_audio', 'AudioReader', 'stream_audio']
 
 
-def load_audio(fname, start_sec=None, end_sec=None, backend='soundfile'):
+def load_audio(fname, start_sec=None, end_sec=None, backend='soundfile', dtype=None):
+    '''
+    Returns a (num_channels, num_samples) array and the sampling rate.
+    dtype only applies to the mmap backend: None returns the zero-copy view in
+    the file's native sample dtype; a float dtype converts (scaled to [-1, 1)
+    like soundfile) only the requested window.
+    '''
     if backend == 'soundfile':
         return _sf_load_audio(fname, start_sec, end_sec)
     elif backend == 'torchaudio':
         return _ta_load_audio(fname, start_sec, end_sec)
+    elif backend == 'mmap':
+        return _mmap_load_audio(fname, start_sec, end_sec, dtype)
     else:
         raise ValueError('unknown backend {}'.format(backend))
 
 
 def _sf_load_audio(fname, start_sec, end_sec):
+    import soundfile as sf
     with sf.SoundFile(fname) as f:
         sampling_rate = f.samplerate
         duration_secs = f.frames / sampling_rate
@@ -27,6 +41,7 @@ def _sf_load_audio(fname, start_sec, end_sec):
 
 
 def _ta_load_audio(fname, start_sec, end_sec):
+    import torchaudio as ta  # pulls in torch; only when asked for
     meta = ta.info(fname)[0]
     sampling_rate = meta.rate
     duration_secs = meta.length / sampling_rate
@@ -35,3 +50,378 @@ def _ta_load_audio(fname, start_sec, end_sec):
     data, sr = ta.load(fname, offset=start, num_frames=end - start)
     data = data.numpy()
     return data, int(sampling_rate)
+
+
+def stream_audio(
+    fname, chunk_secs, hop_secs=None, start_sec=None, end_sec=None,
+    pad_last=False, backend='soundfile', dtype=None, prefetch=0
+):
+    '''
+    Iterate over [start_sec, end_sec) in fixed size chunks without ever
+    materializing the whole range; memory stays bounded by the chunk size.
+
+    Yields (chunk_start_sec, chunk), where chunk is (num_channels, num_samples)
+    and chunk_start_sec is chunk_start_frame / sr, i.e. sample-accurate.
+    Chunks start every hop samples (default: no overlap) and stop once a chunk
+    reaches end_sec. The last chunk is shorter unless pad_last, in which case
+    it is zero-padded to full size.
+
+    Args:
+        backend: 'soundfile' reads through SoundFile.blocks; 'mmap' slices the
+            memory-mapped wav and, like load_audio, honors dtype.
+        prefetch: if > 0, decode in a background thread that runs up to this
+            many chunks ahead of the consumer.
+    '''
+    if backend == 'soundfile':
+        chunks = _sf_stream_audio(fname, chunk_secs, hop_secs, start_sec, end_sec, pad_last)
+    elif backend == 'mmap':
+        chunks = _mmap_stream_audio(
+            fname, chunk_secs, hop_secs, start_sec, end_sec, pad_last, dtype
+        )
+    else:
+        raise ValueError('unknown backend {}'.format(backend))
+
+    if prefetch > 0:
+        chunks = _prefetch(chunks, prefetch)
+    return chunks
+
+
+def _chunk_frames(chunk_secs, hop_secs, sampling_rate):
+    chunk = int(round(chunk_secs * sampling_rate))
+    hop = chunk if hop_secs is None else int(round(hop_secs * sampling_rate))
+    if chunk <= 0 or hop <= 0:
+        raise ValueError(f"chunk and hop must span at least 1 sample; got {chunk}, {hop}")
+    return chunk, hop
+
+
+def _sf_stream_audio(fname, chunk_secs, hop_secs, start_sec, end_sec, pad_last):
+    import soundfile as sf
+    fill_value = 0 if pad_last else None
+    with sf.SoundFile(fname) as f:
+        sampling_rate = f.samplerate
+        start, end = check_start_end_time(start_sec, end_sec, f.frames / sampling_rate)
+        start, end = int(start * sampling_rate), int(end * sampling_rate)
+        chunk, hop = _chunk_frames(chunk_secs, hop_secs, sampling_rate)
+        if start == end:
+            return
+
+        f.seek(start)
+        if hop <= chunk:
+            blocks = f.blocks(
+                blocksize=chunk, overlap=chunk - hop, frames=end - start,
+                dtype='float32', always_2d=True, fill_value=fill_value
+            )
+            for inx, block in enumerate(blocks):
+                yield (start + inx * hop) / sampling_rate, block.T
+        else:  # gaps between chunks; seek over them
+            for s in range(start, end, hop):
+                f.seek(s)
+                # read() only pads up to the size of out
+                out = np.empty((chunk, f.channels), dtype=np.float32) if pad_last else None
+                block = f.read(
+                    frames=min(chunk, end - s), dtype='float32', always_2d=True,
+                    fill_value=fill_value, out=out
+                )
+                yield s / sampling_rate, block.T
+                if s + chunk >= end:
+                    break
+
+
+def _mmap_stream_audio(fname, chunk_secs, hop_secs, start_sec, end_sec, pad_last, dtype):
+    fname = os.path.abspath(fname)
+    header, data = _open_wav_memmap(fname)
+    sampling_rate = header.sampling_rate
+    start, end = check_start_end_time(start_sec, end_sec, header.num_frames / sampling_rate)
+    start, end = int(start * sampling_rate), int(end * sampling_rate)
+    chunk, hop = _chunk_frames(chunk_secs, hop_secs, sampling_rate)
+    convert = dtype is not None and np.dtype(dtype) != header.dtype
+
+    for s in range(start, end, hop):
+        block = data[s:min(s + chunk, end)].T
+        if convert:
+            block = _convert_pcm(block, np.dtype(dtype))
+        if pad_last and block.shape[1] < chunk:
+            padded = np.zeros((block.shape[0], chunk), dtype=block.dtype)
+            padded[:, :block.shape[1]] = block
+            block = padded
+        yield s / sampling_rate, block
+        if s + chunk >= end:
+            break
+
+
+def _prefetch(iterable, size):
+    '''run the producer in a daemon thread, at most size items ahead'''
+    buf = queue.Queue(maxsize=size)
+    sentinel = object()
+    stop = threading.Event()
+
+    def _produce():
+        try:
+            for item in iterable:
+                while not stop.is_set():
+                    try:
+                        buf.put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set():
+                    return
+            buf.put(sentinel)
+        except BaseException as e:  # surface the error in the consumer
+            buf.put(e)
+
+    worker = threading.Thread(target=_produce, daemon=True)
+    worker.start()
+    try:
+        while True:
+            item = buf.get()
+            if item is sentinel:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+    finally:
+        stop.set()  # the consumer quit early; unblock and retire the producer
+
+
+class AudioReader():
+    '''
+    Keeps a bounded LRU pool of open SoundFile handles so that a sampler
+    pulling many windows out of the same files does not pay an open/close
+    (expensive over NFS) for every window.
+
+    The pool is dropped on pickling and lazily refilled in the new process,
+    so the reader can be handed to torch dataloader workers.
+    '''
+    def __init__(self, max_open=64, max_gap_secs=1.0, max_span_secs=30.0):
+        '''
+        Args:
+            max_open: the max number of file handles kept open
+            max_gap_secs: in read_windows, windows less than this far apart
+                are served by one contiguous read instead of another seek
+            max_span_secs: a contiguous read is never grown past this length,
+                however long the chain of overlapping windows
+        '''
+        assert max_open > 0
+        self.max_open = max_open
+        self.max_gap_secs = max_gap_secs
+        self.max_span_secs = max_span_secs
+        self._handles = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _get_handle(self, fname):
+        f = self._handles.get(fname)
+        if f is None:
+            import soundfile as sf
+            f = sf.SoundFile(fname)
+            self._handles[fname] = f
+            if len(self._handles) > self.max_open:
+                _, evicted = self._handles.popitem(last=False)
+                evicted.close()
+        else:
+            self._handles.move_to_end(fname)
+        return f
+
+    def read(self, fname, start_sec=None, end_sec=None):
+        '''same semantics as load_audio with the soundfile backend'''
+        with self._lock:
+            f = self._get_handle(fname)
+            sampling_rate = f.samplerate
+            start, end = check_start_end_time(start_sec, end_sec, f.frames / sampling_rate)
+            start, end = int(start * sampling_rate), int(end * sampling_rate)
+            f.seek(start)
+            data = f.read(frames=end - start, dtype='float32', always_2d=True)
+        return data.T, sampling_rate
+
+    def read_windows(self, fname, windows):
+        '''
+        Args:
+            windows: a list of (start_sec, end_sec) of the same duration
+        Returns:
+            a (num_windows, num_channels, num_samples) float32 array in the
+            order of the given windows, and the sampling rate.
+            Each window starts at int(start_sec * sr) and spans
+            round((end_sec - start_sec) * sr) samples, so that windows of equal
+            duration always stack. The rounding may reach one sample past the
+            end of the file; that sample is zero-padded, never taken by moving
+            the window.
+        '''
+        assert len(windows) > 0
+        with self._lock:
+            f = self._get_handle(fname)
+            sampling_rate = f.samplerate
+            duration_secs = f.frames / sampling_rate
+
+            starts, sizes = [], set()
+            for (start_sec, end_sec) in windows:
+                start_sec, end_sec = check_start_end_time(start_sec, end_sec, duration_secs)
+                starts.append(int(start_sec * sampling_rate))
+                sizes.add(round((end_sec - start_sec) * sampling_rate))
+            if len(sizes) > 1:
+                raise ValueError(f"windows must be of the same duration; got sizes {sorted(sizes)}")
+            size = sizes.pop()
+
+            out = np.empty((len(windows), f.channels, size), dtype=np.float32)
+            max_gap = int(self.max_gap_secs * sampling_rate)
+            max_span = int(self.max_span_secs * sampling_rate)
+            spans = _coalesce_windows(starts, size, max_gap, max_span)
+            for span_start, span_end, members in spans:
+                f.seek(span_start)
+                span = f.read(
+                    frames=span_end - span_start, dtype='float32', always_2d=True, fill_value=0
+                )
+                for inx in members:
+                    offset = starts[inx] - span_start
+                    out[inx] = span[offset:offset + size].T
+        return out, sampling_rate
+
+    def close(self):
+        with self._lock:
+            for f in self._handles.values():
+                f.close()
+            self._handles.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_handles'] = OrderedDict()
+        state['_lock'] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__ = state
+        self._lock = threading.Lock()
+
+
+def _coalesce_windows(starts, size, max_gap, max_span):
+    '''
+    Sort the windows and merge those that overlap or sit within max_gap
+    frames of each other into contiguous spans of at most max_span frames,
+    or a single window where that is longer.
+    Yields (span_start, span_end, [window indices]).
+    '''
+    order = sorted(range(len(starts)), key=lambda i: starts[i])
+    span_start, span_end, members = None, None, []
+    for i in order:
+        s = starts[i]
+        if span_start is not None and s - span_end <= max_gap \
+                and s + size - span_start <= max_span:
+            span_end = max(span_end, s + size)
+            members.append(i)
+            continue
+        if span_start is not None:
+            yield span_start, span_end, members
+        span_start, span_end, members = s, s + size, [i]
+    if span_start is not None:
+        yield span_start, span_end, members
+
+
+WavHeader = namedtuple(
+    'WavHeader', ['sampling_rate', 'num_channels', 'num_frames', 'dtype', 'data_offset']
+)
+
+_WAVE_FORMAT_PCM = 0x0001
+_WAVE_FORMAT_IEEE_FLOAT = 0x0003
+_WAVE_FORMAT_EXTENSIBLE = 0xFFFE
+
+
+def parse_wav_header(fname):
+    '''
+    Walk the RIFF chunks up to 'data' and return where the samples live.
+    Only layouts that map onto a numpy dtype are accepted: 8/16/32 bit
+    integer pcm and 32/64 bit float. 24 bit pcm has no numpy equivalent.
+    '''
+    with open(fname, 'rb') as f:
+        riff, _, wave = struct.unpack('<4sI4s', f.read(12))
+        if riff != b'RIFF' or wave != b'WAVE':
+            raise ValueError(f"{fname} is not a RIFF/WAVE file")
+
+        fmt = None
+        while True:
+            chunk = f.read(8)
+            if len(chunk) < 8:
+                raise ValueError(f"{fname} has no data chunk")
+            chunk_id, chunk_size = struct.unpack('<4sI', chunk)
+            if chunk_id == b'fmt ':
+                fmt = f.read(chunk_size)
+                if chunk_size % 2:
+                    f.seek(1, os.SEEK_CUR)
+            elif chunk_id == b'data':
+                data_offset, data_size = f.tell(), chunk_size
+                break
+            else:
+                f.seek(chunk_size + chunk_size % 2, os.SEEK_CUR)  # chunks are word aligned
+
+    if fmt is None:
+        raise ValueError(f"{fname} has no fmt chunk before the data chunk")
+
+    tag, num_channels, sampling_rate, _, block_align, bits = struct.unpack('<HHIIHH', fmt[:16])
+    if tag == _WAVE_FORMAT_EXTENSIBLE:
+        tag = struct.unpack('<H', fmt[24:26])[0]  # leading bytes of the subformat guid
+
+    if tag == _WAVE_FORMAT_PCM and bits in (8, 16, 32):
+        dtype = np.dtype('u1') if bits == 8 else np.dtype(f'<i{bits // 8}')
+    elif tag == _WAVE_FORMAT_IEEE_FLOAT and bits in (32, 64):
+        dtype = np.dtype(f'<f{bits // 8}')
+    else:
+        raise ValueError(f"{fname}: cannot memory-map format tag {tag} with {bits} bits")
+
+    # chunks after 'data', e.g. a LIST tag, are not samples. Streamed writers
+    # often leave the declared size at 0 or 0xFFFFFFFF; only then, or when it
+    # runs past the end of a truncated file, fall back to the file size
+    file_data_size = os.path.getsize(fname) - data_offset
+    if data_size in (0, 0xFFFFFFFF) or data_size > file_data_size:
+        data_size = file_data_size
+    num_frames = data_size // block_align
+    return WavHeader(sampling_rate, num_channels, num_frames, dtype, data_offset)
+
+
+@lru_cache(maxsize=4096)
+def _wav_header(fname, mtime_ns):
+    # mtime is part of the key so that a rewritten file is re-parsed
+    return parse_wav_header(fname)
+
+
+def _open_wav_memmap(fname):
+    '''
+    Only the parsed header is cached. Every np.memmap holds a file descriptor
+    for as long as it, or an array viewing it, is alive; caching those would
+    pin one fd per file seen, per dataloader worker.
+    '''
+    header = _wav_header(fname, os.stat(fname).st_mtime_ns)
+    data = np.memmap(
+        fname, dtype=header.dtype, mode='r', offset=header.data_offset,
+        shape=(header.num_frames, header.num_channels)
+    )
+    return header, data
+
+
+def _mmap_load_audio(fname, start_sec, end_sec, dtype=None):
+    fname = os.path.abspath(fname)
+    header, data = _open_wav_memmap(fname)
+    sampling_rate = header.sampling_rate
+    duration_secs = header.num_frames / sampling_rate
+    start, end = check_start_end_time(start_sec, end_sec, duration_secs)
+    start, end = int(start * sampling_rate), int(end * sampling_rate)
+    data = data[start:end].T
+
+    if dtype is not None and np.dtype(dtype) != header.dtype:
+        data = _convert_pcm(data, np.dtype(dtype))
+    return data, sampling_rate
+
+
+def _convert_pcm(data, dtype):
+    src = data.dtype
+    if dtype.kind != 'f' or src.kind == 'f':
+        return data.astype(dtype)
+    if src.kind == 'u':  # 8 bit wav is unsigned with a 128 offset
+        out = data.astype(dtype)
+        out -= 128
+        out /= 128
+        return out
+    return np.multiply(data, 1 / 2 ** (8 * src.itemsize - 1), dtype=dtype)
@@ -26,8 +26,6 @@ import io
 import platform
 import lmdb
 import pickle
-from PIL import Image
-from tqdm import tqdm
 # from dataflow.utils import logger  # TODO: add a consistent logger for fabric itself
 logger = logging.getLogger(__name__)
 
@@ -70,6 +68,7 @@ def save_to_lmdb(db_fname, stream, write_frequency=5000):
         write_frequency (int): the frequency to write back data to disk.
             A smaller value reduces memory usage.
     """
+    from tqdm import tqdm
 
     db_fname = Path(db_fname).resolve()
     assert not db_fname.exists(), f"LMDB file {db_fname} exists!"
@@ -246,6 +245,7 @@ class ImageLMDB(LMDBData):
 
     @classmethod
     def convert_bytes_into_image(cls, bytes_data):
+        from PIL import Image
         buf = io.BytesIO()
         buf.write(bytes_data)
         buf.seek(0)
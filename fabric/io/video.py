@@ -1,26 +1,134 @@
 import os.path as osp
 import contextlib
 import gc
+import logging
 import math
+import os
 import re
+import time
 import warnings
+from collections import deque
+from multiprocessing import Pool
 
 import numpy as np
 import av
 
 from .common import check_start_end_time
 from .audio import load_audio
+from .lmdb_tools import save_to_lmdb, pillow_img_to_bytes
 
-# PyAV has some reference cycles
-_CALLED_TIMES = 0
-_GC_COLLECTION_INTERVAL = 10
+logger = logging.getLogger(__name__)
 
-# decide the audio loading method; pyav audio loading is inconsisten and slow
-# for now, load the transcoded wav file as a walkaround
-_AUDIO_LOAD_FROM_TRANSCODE = True
+# older PyAV releases leak frames through reference cycles; see GCPolicy
+_PROC_STATM = '/proc/self/statm'
 
+# decide the audio loading method. The in-container path decodes, trims and
+# resamples with pyav directly; set to True to read the transcoded wav instead.
+_AUDIO_LOAD_FROM_TRANSCODE = False
 
-__all__ = ['Video']
+_CHANNEL_LAYOUTS = {1: 'mono', 2: 'stereo'}
+_AUDIO_PREROLL_FRAMES = 2
+
+
+__all__ = ['Video', 'dump_key_frames_to_lmdb', 'set_gc_policy', 'get_gc_policy']
+
+
+class GCPolicy():
+    '''
+    Decides when a stream read triggers a full gc.collect(). A full collection
+    stalls a dataloader worker for milliseconds, so only collect as often as
+    the installed PyAV actually needs; readers here release frames and
+    containers deterministically, and recent PyAV frees them by refcount.
+    modes:
+        'never':    never collect ('off' is accepted as well)
+        'always':   collect after every read, the most conservative
+        'interval': collect every `interval` reads
+        'memory':   collect once the RSS grew by `mem_threshold_mb` since the
+                    policy was first used or last collected (linux only;
+                    needs /proc)
+    hook, if given, is called as hook(elapsed_secs, num_collected) after every
+    collection; stats() reports the accumulated collection time.
+    '''
+    MODES = ('never', 'always', 'interval', 'memory')
+
+    def __init__(self, mode='interval', interval=10, mem_threshold_mb=512, hook=None):
+        mode = 'never' if mode == 'off' else mode
+        if mode not in self.MODES:
+            raise ValueError(f"gc mode must be one of {self.MODES}; got {mode}")
+        if mode == 'memory' and not osp.isfile(_PROC_STATM):
+            raise ValueError("the memory gc policy needs /proc/self/statm")
+        assert interval > 0 and mem_threshold_mb > 0
+        self.mode = mode
+        self.interval = interval
+        self.mem_threshold_mb = mem_threshold_mb
+        self.hook = hook
+
+        self.calls = 0
+        self.num_collections = 0
+        self.collection_secs = 0.
+        # taken at the first read, not at construction: the default policy
+        # is built at import, before the dataloader worker has loaded anything
+        self._baseline_mb = None
+
+    def step(self):
+        self.calls += 1
+        if self.mode == 'always':
+            self.collect()
+        elif self.mode == 'interval':
+            if self.calls % self.interval == 0:
+                self.collect()
+        elif self.mode == 'memory':
+            if self._baseline_mb is None:
+                self._baseline_mb = _rss_mb()
+            elif _rss_mb() - self._baseline_mb > self.mem_threshold_mb:
+                self.collect()
+
+    def collect(self):
+        start = time.perf_counter()
+        num_collected = gc.collect()
+        elapsed = time.perf_counter() - start
+        self.num_collections += 1
+        self.collection_secs += elapsed
+        if self.mode == 'memory':
+            # re-arm relative to what survived, so that legitimately held
+            # memory does not make every later read collect again
+            self._baseline_mb = _rss_mb()
+        if self.hook is not None:
+            self.hook(elapsed, num_collected)
+
+    def stats(self):
+        return {
+            'mode': self.mode,
+            'calls': self.calls,
+            'num_collections': self.num_collections,
+            'collection_secs': self.collection_secs,
+        }
+
+
+def _rss_mb():
+    with open(_PROC_STATM, 'r') as f:
+        resident_pages = int(f.read().split()[1])
+    return resident_pages * os.sysconf('SC_PAGE_SIZE') / 2 ** 20
+
+
+def _default_gc_policy():
+    if osp.isfile(_PROC_STATM):
+        return GCPolicy('memory')
+    return GCPolicy('interval', interval=10)
+
+
+_GC_POLICY = _default_gc_policy()
+
+
+def set_gc_policy(mode, **kwargs):
+    '''install a GCPolicy for this process (e.g. in a dataloader worker_init_fn)'''
+    global _GC_POLICY
+    _GC_POLICY = GCPolicy(mode, **kwargs)
+    return _GC_POLICY
+
+
+def get_gc_policy():
+    return _GC_POLICY
 
 
 class VideoMeta():
@@ -119,6 +227,7 @@ class Video():
         vdata = np.stack(
             [frame.to_rgb().to_ndarray() for frame in vframes], axis=0
         )
+        vframes.clear()  # hand the decoded frames back right away
         return vdata
 
     def grab_video_key_frame(self, start_sec=None, end_sec=None):
@@ -134,33 +243,74 @@ class Video():
         frame = frame.to_rgb().to_ndarray()
         return frame
 
-    def load_audio_frames(self, start_sec=None, end_sec=None):
-        if _AUDIO_LOAD_FROM_TRANSCODE:
-            transcode_audio_fname = osp.splitext(self.fname)[0] + '.wav'
-            if not osp.isfile(transcode_audio_fname):
-                raise ValueError("the transcoded audio file does not exist")
-            adata, sr = load_audio(
-                transcode_audio_fname, start_sec, end_sec, backend='soundfile'
+    def grab_key_frames(self, num_frames, max_side=None):
+        '''
+        Grab the keyframes nearest (at or before) num_frames evenly spaced
+        time points, without decoding any non-key frame.
+        Args:
+            max_side: if given, frames are downscaled during the rgb conversion
+                so that the longer side is at most max_side pixels
+        Returns:
+            a list of at most num_frames (H, W, 3) uint8 arrays, in time order.
+            A time point at which nothing decodes (e.g. a truncated file) is
+            skipped rather than filled. Sparse keyframes may make neighboring
+            entries repeat the same keyframe; they are kept, so that entry i
+            always stands for a time point.
+        '''
+        self._confirm_container_opened()
+        if not self.meta.has_video():
+            raise ValueError("no visual for this file")
+        length = self.meta.video['length_in_secs']
+        height, width = self.meta.video['spatial_size']
+        width, height = _downscaled_size(width, height, max_side)
+
+        frames = []
+        for i in range(num_frames):
+            mid_point = (i + 0.5) * length / num_frames
+            frame = _grab_video_key_frame(self.container, mid_point, mid_point)
+            if frame is None:
+                continue
+            frame = frame.reformat(
+                width=width, height=height, format='rgb24', interpolation='AREA'
             )
-            return adata, sr
+            frames.append(frame.to_ndarray())
+        return frames
+
+    def load_audio_frames(
+        self, start_sec=None, end_sec=None, sampling_rate=None, num_channels=None
+    ):
+        if _AUDIO_LOAD_FROM_TRANSCODE:
+            if sampling_rate is not None or num_channels is not None:
+                raise ValueError("resampling is only supported for in-container loading")
+            return self._load_audio_from_transcode(start_sec, end_sec)
         else:
-            self._confirm_container_opened()
-            if not self.meta.has_audio():
-                raise ValueError("no audio for this file")
-            start_sec, end_sec = check_start_end_time(
-                start_sec, end_sec, self.meta.audio['length_in_secs']
+            return self._load_audio_from_container(
+                start_sec, end_sec, sampling_rate, num_channels
             )
 
-            container = self.container
+    def _load_audio_from_transcode(self, start_sec, end_sec):
+        transcode_audio_fname = osp.splitext(self.fname)[0] + '.wav'
+        if not osp.isfile(transcode_audio_fname):
+            raise ValueError("the transcoded audio file does not exist")
+        adata, sr = load_audio(
+            transcode_audio_fname, start_sec, end_sec, backend='soundfile'
+        )
+        return adata, sr
 
-            aframes = read_from_stream(
-                container, container.streams.audio[0], {'audio': 0},
-                start_sec, end_sec
-            )
-            adata = np.concatenate(
-                [frame.to_ndarray() for frame in aframes], axis=1
-            )
-            return adata
+    def _load_audio_from_container(
+        self, start_sec, end_sec, sampling_rate=None, num_channels=None
+    ):
+        self._confirm_container_opened()
+        if not self.meta.has_audio():
+            raise ValueError("no audio for this file")
+        start_sec, end_sec = check_start_end_time(
+            start_sec, end_sec, self.meta.audio['length_in_secs']
+        )
+        adata, sr = _decode_audio(
+            self.container, self.container.streams.audio[0],
+            start_sec, end_sec, sampling_rate, num_channels
+        )
+        return adata, sr
 
 
 def read_from_stream(container, stream, stream_info, start_secs, end_secs):
@@ -171,22 +321,118 @@ def read_from_stream(container, stream, stream_info, start_secs, end_secs):
 
 
 def _grab_video_key_frame(container, start_secs, end_secs):
+    _GC_POLICY.step()
+
     video_stream = container.streams.video[0]
-    video_stream.codec_context.skip_frame = 'NONKEY'
-    mid_point = (start_secs + end_secs) / 2
-    offset = int(math.floor(mid_point * (1 / video_stream.time_base)))
-    container.seek(offset, any_frame=False, backward=True, stream=video_stream)
-    for frame in container.decode(video_stream):
-        return frame
+    codec_context = video_stream.codec_context
+    skip_frame = codec_context.skip_frame
+    codec_context.skip_frame = 'NONKEY'
+    try:
+        mid_point = (start_secs + end_secs) / 2
+        offset = int(math.floor(mid_point * (1 / video_stream.time_base)))
+        container.seek(offset, any_frame=False, backward=True, stream=video_stream)
+        decoder = container.decode(video_stream)
+        try:
+            for frame in decoder:
+                return frame
+        finally:
+            decoder.close()  # drop the generator's hold on the packet now
+        return None
+    finally:
+        # the setting sticks to the codec; later full decodes would skip frames
+        codec_context.skip_frame = skip_frame
+
+
+def _downscaled_size(width, height, max_side):
+    if max_side is None or max(width, height) <= max_side:
+        return width, height
+    scale = max_side / max(width, height)
+    # even dims keep chroma-subsampled conversions happy
+    width = max(2, int(round(width * scale / 2)) * 2)
+    height = max(2, int(round(height * scale / 2)) * 2)
+    return width, height
+
+
+def _key_frames_worker(args):
+    fname, num_frames, max_side, img_format = args
+    try:
+        v = Video(fname)
+        with v.open_video():
+            frames = v.grab_key_frames(num_frames, max_side)
+    except Exception as e:  # a corrupt video should not bring down the whole pool
+        logger.warning(f"failed to grab key frames from {fname}: {e}")
+        return []
+    from PIL import Image
+    return [pillow_img_to_bytes(Image.fromarray(f), img_format) for f in frames]
+
+
+class _KeyFrameStream():
+    # videos in flight per worker; bounds the encoded frames held in memory
+    # when the writer falls behind the pool
+    _INFLIGHT_PER_WORKER = 4
+
+    def __init__(self, fnames, keys, num_frames, max_side, num_workers, img_format):
+        self.fnames = fnames
+        self.keys = keys
+        self.num_frames = num_frames
+        self.max_side = max_side
+        self.num_workers = num_workers
+        self.img_format = img_format
+
+    def __len__(self):
+        # an upper bound; videos may yield fewer frames, see grab_key_frames
+        return len(self.fnames) * self.num_frames
+
+    def __iter__(self):
+        jobs = (
+            (key, (fname, self.num_frames, self.max_side, self.img_format))
+            for key, fname in zip(self.keys, self.fnames)
+        )
+        max_inflight = self.num_workers * self._INFLIGHT_PER_WORKER
+        with Pool(self.num_workers) as pool:
+            # Pool.imap would run ahead of the writer without limit; submit a
+            # bounded window instead and collect in input order
+            inflight = deque()
+            for key, args in jobs:
+                inflight.append((key, pool.apply_async(_key_frames_worker, (args, ))))
+                if len(inflight) >= max_inflight:
+                    yield from self._entries(*inflight.popleft())
+            while len(inflight) > 0:
+                yield from self._entries(*inflight.popleft())
+
+    @staticmethod
+    def _entries(key, result):
+        for inx, img_bytes in enumerate(result.get()):
+            yield f"{key}/{inx}", img_bytes
+
+
+def dump_key_frames_to_lmdb(
+    fnames, db_fname, num_frames=8, max_side=256, keys=None,
+    num_workers=8, img_format='jpeg'
+):
+    '''
+    Grab num_frames evenly spaced keyframes from each video across a process
+    pool and store them as encoded images under the keys "{key}/{inx}",
+    readable with ImageLMDB. A video may contribute fewer than num_frames
+    entries (see Video.grab_key_frames), and none if it fails to decode.
+    Args:
+        keys: ascii keys of the videos; defaults to the file stems
+    '''
+    fnames = list(fnames)
+    if keys is None:
+        keys = [osp.splitext(osp.basename(f))[0] for f in fnames]
+    keys = list(keys)
+    assert len(keys) == len(fnames)
+    assert len(set(keys)) == len(keys), "video keys must be unique"
+
+    stream = _KeyFrameStream(fnames, keys, num_frames, max_side, num_workers, img_format)
+    save_to_lmdb(db_fname, stream)
 
 
 def _read_from_stream(
     container, start_offset, end_offset, pts_unit, stream, stream_name
 ):
-    global _CALLED_TIMES, _GC_COLLECTION_INTERVAL
-    _CALLED_TIMES += 1
-    if _CALLED_TIMES % _GC_COLLECTION_INTERVAL == _GC_COLLECTION_INTERVAL - 1:
-        gc.collect()
+    _GC_POLICY.step()
 
     if pts_unit == "sec":
         start_offset = int(math.floor(start_offset * (1 / stream.time_base)))
@@ -233,8 +479,9 @@ def _read_from_stream(
         # print("Corrupted file?", container.name)
         return []
     buffer_count = 0
+    decoder = container.decode(**stream_name)
     try:
-        for _idx, frame in enumerate(container.decode(**stream_name)):
+        for _idx, frame in enumerate(decoder):
             frames[frame.pts] = frame
             if frame.pts >= end_offset:
                 if should_buffer and buffer_count < max_buffer_size:
@@ -244,10 +491,13 @@ def _read_from_stream(
     except av.AVError:
         # TODO add a warning
         pass
+    finally:
+        decoder.close()  # drop the generator's hold on the last packet/frame now
     # ensure that the results are sorted wrt the pts
     result = [
         frames[i] for i in sorted(frames) if start_offset <= frames[i].pts <= end_offset
     ]
+    frames.clear()  # the out-of-range frames go now, not at the next collection
     # WHC edit 2: remove front seeking
     # if len(frames) > 0 and start_offset > 0 and start_offset not in frames:
     #     # if there is no frame that exactly matches the pts of start_offset
@@ -261,18 +511,83 @@ def _read_from_stream(
     return result
 
 
-def _align_audio_frames(aframes, audio_frames, ref_start, ref_end):
+def _decode_audio(
+    container, stream, start_sec, end_sec, sampling_rate=None, num_channels=None
+):
     '''
-    This is logically wrong cuz it assumes that ref_start and end
-    are in the units of stream pts
+    Decode the samples in [start_sec, end_sec) of an audio stream into a
+    (num_channels, num_samples) float32 array, trimmed to the sample.
+    The sample indexing follows the soundfile loader i.e.
+    [int(start_sec * sr), int(end_sec * sr)), so that the two routes agree.
+
+    Frame timestamps come from frame.time rather than the stream time base,
+    since the latter is not always 1 / sampling_rate (e.g. mkv uses 1/1000).
+    Samples the stream fails to deliver (truncated file) are left as zeros.
+    Accuracy is bounded by the container's timestamp precision.
     '''
-    start, end = audio_frames[0].pts, audio_frames[-1].pts
-    total_aframes = aframes.shape[1]
-    step_per_aframe = (end - start + 1) / total_aframes
-    s_idx = 0
-    e_idx = total_aframes
-    if start < ref_start:
-        s_idx = int((ref_start - start) / step_per_aframe)
-    if end > ref_end:
-        e_idx = int((ref_end - end) / step_per_aframe)
-    return aframes[:, s_idx:e_idx]
+    if sampling_rate is None:
+        sampling_rate = stream.sample_rate
+    if num_channels is None:
+        layout = stream.layout.name
+        num_channels = len(stream.layout.channels)
+    elif num_channels in _CHANNEL_LAYOUTS:
+        layout = _CHANNEL_LAYOUTS[num_channels]
+    else:
+        raise ValueError(f"cannot downmix to {num_channels} channels")
+
+    _GC_POLICY.step()
+
+    s0 = int(start_sec * sampling_rate)
+    num_samples = int(end_sec * sampling_rate) - s0
+    buf = np.zeros((num_channels, num_samples), dtype=np.float32)
+    if num_samples == 0:
+        return buf, sampling_rate
+
+    # planar float output; a no-op pass-through when nothing needs converting
+    resampler = av.AudioResampler(format='fltp', layout=layout, rate=sampling_rate)
+
+    def _write(oframes, cursor):
+        # cursor: global output sample index of the next resampled sample
+        for oframe in oframes:
+            arr = oframe.to_ndarray()
+            lo, hi = cursor - s0, cursor - s0 + arr.shape[1]
+            cursor = cursor + arr.shape[1]
+            if hi <= 0:
+                continue
+            a = max(-lo, 0)
+            b = arr.shape[1] - max(hi - num_samples, 0)
+            if a < b:
+                buf[:, lo + a:lo + b] = arr[:, a:b]
+        return cursor
+
+    # transform codecs (e.g. aac) emit garbage for the first frame after a seek;
+    # seek a couple of frames early and let the decoder warm up on those.
+    frame_size = stream.codec_context.frame_size or 0
+    preroll_sec = _AUDIO_PREROLL_FRAMES * frame_size / stream.sample_rate
+    seek_offset = int(math.floor((start_sec - preroll_sec) / stream.time_base))
+    try:
+        container.seek(max(seek_offset, 0), any_frame=False, backward=True, stream=stream)
+    except av.AVError:
+        return buf, sampling_rate
+
+    cursor = None
+    try:
+        for frame in container.decode(stream):
+            if cursor is None:
+                if frame.time is None:
+                    continue
+                frame_end = frame.time + frame.samples / frame.sample_rate
+                if frame_end <= start_sec:
+                    continue
+                # the first frame overlapping the request anchors the output timeline
+                cursor = int(round(frame.time * sampling_rate))
+            frame.pts = None  # let the resampler count samples contiguously
+            cursor = _write(resampler.resample(frame), cursor)
+            if cursor >= s0 + num_samples:
+                break
+        else:
+            if cursor is not None:
+                _write(resampler.resample(None), cursor)
+    except av.AVError:
+        pass
+    return buf, sampling_rate
@@ -1,4 +1,5 @@
 import inspect
+import weakref
 from typing import get_origin, get_args
 from types import FunctionType
 from functools import partial
@@ -50,13 +51,59 @@ def recursively_check_itr_dtype(itr, dtype_container, dtype_member):
 def do_type_check(name, dtype, val):
     # both args are assumed not None
     # dtype might be list[int]
+    compile_validator(name, dtype)(val)
+
+
+def compile_validator(name, dtype):
+    '''
+    Decompose dtype once and return a closure that checks a (non None) value
+    against it, so that get_origin / get_args are not redone for every value.
+    Same semantics and messages as the generic recursive check.
+    '''
     A, B = optionally_break_composite_dtype(dtype)
     if A in ALLOWED_ATOMIC_TYPES:
-        assert type(val) is A, f"dtype mismatch on {name}: expect {A.__name__}, got {val}"
+        def check_atomic(val):
+            assert type(val) is A, f"dtype mismatch on {name}: expect {A.__name__}, got {val}"
+        return check_atomic
     elif A in ALLOWED_ITER_TYPES:
-        recursively_check_itr_dtype(val, A, B)
+        return _compile_itr_validator(A, B)
     else:
-        raise ValueError(f"{name}: {val} of declared type {dtype} not allowed in config")
+        def reject(val):
+            raise ValueError(f"{name}: {val} of declared type {dtype} not allowed in config")
+        return reject
+
+
+def _compile_itr_validator(dtype_container, dtype_member):
+    if dtype_member is None:
+        # member dtype is inferred from the first element; nothing to precompute
+        return partial(recursively_check_itr_dtype, dtype_container=dtype_container, dtype_member=None)
+
+    A, B = optionally_break_composite_dtype(dtype_member)
+    if not (A in ALLOWED_ATOMIC_TYPES or A in ALLOWED_ITER_TYPES):
+        # only an error if there is a member to check; mirror the generic check
+        return partial(recursively_check_itr_dtype, dtype_container=dtype_container, dtype_member=dtype_member)
+
+    def member_error(itr):
+        elem = next(e for e in itr if type(e) is not A)
+        return f"{dtype_container.__name__} member dtype is {A.__name__}; got {elem} of type {type(elem).__name__}"
+
+    if A in ALLOWED_ATOMIC_TYPES:
+        # fast path for e.g. per-layer widths: the type scan runs in C
+        def check_homogeneous(itr):
+            assert isinstance(itr, dtype_container)
+            if list(map(type, itr)).count(A) != len(itr):
+                raise AssertionError(member_error(itr))
+        return check_homogeneous
+
+    check_member = _compile_itr_validator(A, B)
+
+    def check_nested(itr):
+        assert isinstance(itr, dtype_container)
+        for elem in itr:
+            if type(elem) is not A:
+                raise AssertionError(member_error(itr))
+            check_member(elem)
+    return check_nested
 
 
 def check_declared_dtype_and_val(name, dtype, val):
@@ -109,11 +156,36 @@ class TrackerNamespace(dict):
         super().__setitem__(key, value)
 
 
+def invalidate_field_cache(cls=None):
+    '''
+    Drop the resolved fields cached on cls and on every class deriving from
+    it, which inherit its fields; all config classes when cls is None.
+    '''
+    cls = BaseConfig if cls is None else cls
+    stack = [cls]
+    while stack:
+        klass = stack.pop()
+        if '_fields_cache' in klass.__dict__:
+            # type.__delattr__ bypasses TrackFieldsMeta, which would recurse here
+            type.__delattr__(klass, '_fields_cache')
+        stack.extend(type.__subclasses__(klass))
+
+
 class TrackFieldsMeta(type):
     @classmethod
     def __prepare__(metacls, name, bases):
         return TrackerNamespace()
 
+    def __setattr__(cls, key, value):
+        # e.g. mkcfg populating fields, or patching a default on a parent
+        # class, which children inherit; other classes keep their cache.
+        invalidate_field_cache(cls)
+        super().__setattr__(key, value)
+
+    def __delattr__(cls, key):
+        invalidate_field_cache(cls)
+        super().__delattr__(key)
+
     def __new__(metacls, name, bases, namespace):
         """
         By the time we get here, namespace._decl_order has the order of:
@@ -142,6 +214,30 @@ class BaseConfig(metaclass=TrackFieldsMeta):
 
     @classmethod
     def find_fields(cls):
+        '''
+        Resolved once per class and cached; returns a copy, free to mutate.
+        '''
+        return dict(cls._cached_schema()[0])
+
+    @classmethod
+    def _cached_schema(cls):
+        '''(fields, validators of the plainly typed fields); shared, do not mutate'''
+        # look in the class's own __dict__; an inherited cache belongs to the parent
+        cache = cls.__dict__.get('_fields_cache', None)
+        if cache is not None:
+            return cache
+        fields = cls._resolve_fields()
+        validators = {
+            k: compile_validator(k, dtype) for k, (dtype, v) in fields.items()
+            if not (is_config_class(v) or isinstance(v, ConfigArray))
+        }
+        schema = (fields, validators)
+        # bypass TrackFieldsMeta.__setattr__; storing the cache must not invalidate it
+        type.__setattr__(cls, '_fields_cache', schema)
+        return schema
+
+    @classmethod
+    def _resolve_fields(cls):
         mro_reversed = cls.__mro__[::-1]
         assert mro_reversed[1] is BaseConfig and mro_reversed[-1] is cls
         candidates = mro_reversed[2:]  # skip [object, BaseConfig]
@@ -195,7 +291,7 @@ class BaseConfig(metaclass=TrackFieldsMeta):
 
     @classmethod
     def schema(cls, expand_options=True):
-        fields = cls.find_fields()
+        fields = cls._cached_schema()[0]
         res = {}
         for k, (dtype, v) in fields.items():
             if is_config_class(v):
@@ -209,14 +305,20 @@ class BaseConfig(metaclass=TrackFieldsMeta):
                 res[k] = dtype.__name__
         return res
 
-    def __init__(self, user_supplied_cfg: dict = {}):
-        fields = self.find_fields()
+    def __init__(self, user_supplied_cfg: dict = {}, trusted=False):
+        '''
+        Args:
+            trusted: skip value type checks, e.g. for configs read back from a
+                verified cache. The choices on oneof fields are still checked
+                since they decide which config class gets built.
+        '''
+        fields, validators = self._cached_schema()
 
         instantiated_cfg = {}
         for k, (dtype, v) in fields.items():
             if is_config_class(v):
                 _kwargs = user_supplied_cfg.get(k, {})
-                instantiated_cfg[k] = v(_kwargs)
+                instantiated_cfg[k] = v(_kwargs, trusted=trusted)
                 del _kwargs
                 continue
 
@@ -235,14 +337,14 @@ class BaseConfig(metaclass=TrackFieldsMeta):
                     ...
                 '''
                 _kwargs = user_supplied_cfg.get(user_choice, {})
-                instantiated_cfg[user_choice] = v[user_choice](_kwargs)
+                instantiated_cfg[user_choice] = v[user_choice](_kwargs, trusted=trusted)
                 del _kwargs
                 continue
 
             if k in user_supplied_cfg:
                 new_v = user_supplied_cfg[k]
-                if new_v is not None:  # allow user providing None
-                    do_type_check(k, dtype, new_v)
+                if new_v is not None and not trusted:  # allow user providing None
+                    validators[k](new_v)
                 v = new_v
 
             instantiated_cfg[k] = v
@@ -267,6 +369,158 @@ class BaseConfig(metaclass=TrackFieldsMeta):
     def make(self):
         raise NotImplementedError()
 
+    def freeze(self):
+        '''an immutable, hashable snapshot; see FrozenConfig'''
+        keys = tuple(self._cfg_dict.keys())
+        values = tuple(
+            v.freeze() if isinstance(v, BaseConfig) else v
+            for v in self._cfg_dict.values()
+        )
+        return _frozen_class(type(self), keys)._build(values)
+
+    def fingerprint(self):
+        '''content hash stable across processes and key order; see config_fingerprint'''
+        from .deploy.fingerprint import config_fingerprint
+        return config_fingerprint(self.as_dict())
+
+
+class FrozenConfig():
+    '''
+    Immutable snapshot of a config, for keying result caches and deduping
+    sweep points. Instances of the generated subclass keep their fields in
+    __slots__ (no per-instance __dict__), cache their structural hash after the
+    first computation, and replace() shares every untouched field, nested
+    configs included, with the original instead of copying the tree.
+
+    Like as_dict(), list values are shared, not deep-frozen; do not mutate them.
+    '''
+    __slots__ = ('_hash',)
+
+    # set on the generated subclasses
+    _source_cls = None
+    _keys = ()
+
+    def __init__(self, *args, **kwargs):
+        raise TypeError("build frozen configs with BaseConfig.freeze()")
+
+    @classmethod
+    def _build(cls, values):
+        obj = object.__new__(cls)
+        for k, v in zip(cls._keys, values):
+            object.__setattr__(obj, k, v)
+        object.__setattr__(obj, '_hash', None)
+        return obj
+
+    def _values(self):
+        return tuple(getattr(self, k) for k in self._keys)
+
+    def __setattr__(self, key, value):
+        raise AttributeError(f"frozen config is immutable; use replace({key}=...)")
+
+    def __delattr__(self, key):
+        raise AttributeError("frozen config is immutable")
+
+    def __hash__(self):
+        h = self._hash
+        if h is None:
+            h = hash((self._source_cls, self._keys, _hashable(self._values())))
+            object.__setattr__(self, '_hash', h)
+        return h
+
+    def __eq__(self, other):
+        if self is other:
+            return True
+        if type(other) is not type(self):
+            return NotImplemented
+        if hash(self) != hash(other):
+            return False
+        return self._values() == other._values()
+
+    def replace(self, **changes):
+        '''
+        A new frozen config with the given fields changed. Plain fields are
+        type checked; nested config fields take a FrozenConfig or a dict.
+        '''
+        fields, validators = self._source_cls._cached_schema()
+        values = dict(zip(self._keys, self._values()))
+        for k, new_v in changes.items():
+            if k not in values or k not in fields:
+                raise KeyError(f"{k} is not a replaceable field of {self._source_cls.__name__}")
+            dtype, default = fields[k]
+            if is_config_class(default):
+                if isinstance(new_v, dict):
+                    new_v = default(new_v).freeze()
+                assert isinstance(new_v, FrozenConfig) and new_v._source_cls is default, \
+                    f"{k} expects a frozen {default.__name__}"
+            elif isinstance(default, ConfigArray):
+                raise KeyError(f"{k} is a oneof choice; thaw() and rebuild to switch options")
+            elif new_v is not None:
+                validators[k](new_v)
+            values[k] = new_v
+        return type(self)._build(tuple(values.values()))
+
+    def as_dict(self):
+        res = {}
+        for k, v in zip(self._keys, self._values()):
+            res[k] = v.as_dict() if isinstance(v, FrozenConfig) else v
+        return res
+
+    def fingerprint(self):
+        from .deploy.fingerprint import config_fingerprint
+        return config_fingerprint(self.as_dict())
+
+    def thaw(self):
+        '''back to a regular, mutable config; the values were validated when frozen'''
+        return self._source_cls(self.as_dict(), trusted=True)
+
+    def __reduce__(self):
+        return (_rebuild_frozen, (self._source_cls, self._keys, self._values()))
+
+    def __str__(self):
+        return pformat(self.as_dict(), sort_dicts=False)
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()})"
+
+
+# config class -> {field keys: frozen class}, both held weakly: a frozen class
+# lives as long as its instances, and keeps its config class alive meanwhile
+_FROZEN_CLASSES = weakref.WeakKeyDictionary()
+
+# a field in __slots__ would shadow these
+_FROZEN_RESERVED = frozenset(k for k in vars(FrozenConfig) if not k.startswith('_'))
+
+
+def _frozen_class(source_cls, keys):
+    '''
+    One generated subclass per (config class, field keys); the keys are part
+    of it since oneof choices add a per-instance field named after the option.
+    '''
+    per_keys = _FROZEN_CLASSES.setdefault(source_cls, weakref.WeakValueDictionary())
+    cls = per_keys.get(keys)
+    if cls is None:
+        shadowed = _FROZEN_RESERVED.intersection(keys)
+        if shadowed:
+            raise ValueError(
+                f"cannot freeze {source_cls.__name__}: fields {sorted(shadowed)} "
+                f"would shadow the FrozenConfig methods of the same name"
+            )
+        cls = type(f"Frozen{source_cls.__name__}", (FrozenConfig,), {
+            '__slots__': keys, '_source_cls': source_cls, '_keys': keys,
+        })
+        per_keys[keys] = cls
+    return cls
+
+
+def _rebuild_frozen(source_cls, keys, values):
+    return _frozen_class(source_cls, keys)._build(values)
+
+
+def _hashable(val):
+    if isinstance(val, (list, tuple)):
+        return tuple(_hashable(v) for v in val)
+    return val
+
 
 def extract_config_knobs_from_callable(obj):
     '''keyword-only parameters i.e. those coming after * in a function def are treated as configurable.
@@ -1,5 +1,31 @@
-from .event import EventStorage, get_event_storage, read_stats
+import importlib
+
+# tqdm.py defers the tqdm import itself. Keep it eager: a lazy attribute named
+# like its submodule would be shadowed by the module once that is imported
 from .tqdm import tqdm
-from .heartbeat import HeartBeat, get_heartbeat
-from .debug import EarlyLoopBreak
-from .git import tag_version
+
+# the rest resolve on first access (PEP 562), so that importing one utility,
+# e.g. by the sow / smit entry points, does not load all of them
+_LAZY_ATTRS = {
+    'EventStorage': '.event',
+    'get_event_storage': '.event',
+    'read_stats': '.event',
+    'HeartBeat': '.heartbeat',
+    'get_heartbeat': '.heartbeat',
+    'EarlyLoopBreak': '.debug',
+    'tag_version': '.git',
+}
+
+__all__ = ['tqdm'] + list(_LAZY_ATTRS.keys())
+
+
+def __getattr__(name):
+    if name not in _LAZY_ATTRS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    val = getattr(importlib.import_module(_LAZY_ATTRS[name], __name__), name)
+    globals()[name] = val  # later lookups skip __getattr__
+    return val
+
+
+def __dir__():
+    return sorted(set(globals().keys()) | set(_LAZY_ATTRS.keys()))
@@ -1,9 +1,9 @@
 from pathlib import Path
 import hashlib
-from tqdm import tqdm
 
 
 def get_digest(file_path):
+    from tqdm import tqdm
     file_path = Path(file_path)
     size = file_path.stat().st_size
 
@@ -1,6 +1,9 @@
 from pathlib import Path
 import json
-from inspect import stack
+import os
+import socket
+import sys
+import threading
 from .ticker import IntervalTicker
 
 _CURRENT_BEAT_STACK = []
@@ -26,20 +29,81 @@ def get_tqdm_meter(pbar, format_dict):
 
 
 def caller_info(n_stack_up):
-    info = stack()[1 + n_stack_up]  # 1 up as base so that it starts from caller
-    msg = f"{info.filename}:{info.lineno} - {info.function}"
+    # 1 up as base so that it starts from caller; a frame lookup, unlike
+    # inspect.stack() which reads the source of every frame on the stack
+    frame = sys._getframe(1 + n_stack_up)
+    code = frame.f_code
+    msg = f"{code.co_filename}:{frame.f_lineno} - {code.co_name}"
     return msg
 
 
+def write_json_atomic(fname, obj):
+    '''
+    write aside and rename, so a reader, possibly on another NFS client, sees
+    either the old file or the new one and never a half-written one
+    '''
+    fname = Path(fname)
+    # unique per writer; two hosts may share the run dir
+    tmp_fname = fname.with_name(f".{fname.name}.{socket.gethostname()}.{os.getpid()}.tmp")
+    with open(tmp_fname, "w") as f:
+        json.dump(obj, f)
+    os.replace(tmp_fname, fname)
+
+
+class _BackgroundWriter():
+    '''
+    writes the latest stats handed to it on its own thread; stats that arrive
+    while a write is in flight replace each other, only the newest is written
+    '''
+    def __init__(self, fname):
+        self.fname = fname
+        self.cond = threading.Condition()
+        self.pending = None
+        self.closed = False
+        self.thread = threading.Thread(target=self._run, name="heartbeat", daemon=True)
+        self.thread.start()
+
+    def put(self, stats):
+        with self.cond:
+            self.pending = stats
+            self.cond.notify()
+
+    def close(self):
+        '''returns once the pending stats are on disk'''
+        with self.cond:
+            self.closed = True
+            self.cond.notify()
+        self.thread.join()
+
+    def _run(self):
+        while True:
+            with self.cond:
+                while self.pending is None and not self.closed:
+                    self.cond.wait()
+                if self.pending is None:
+                    return
+                stats, self.pending = self.pending, None
+            try:
+                write_json_atomic(self.fname, stats)
+            except OSError as e:
+                # a hiccup on the file system must not take the training down
+                print(f"heartbeat write failed: {e}", file=sys.stderr)
+
+
 class HeartBeat():
+    '''
+    background: write from a thread, so that beat() costs a clock check and,
+    once per write_interval, formatting the stats; never the file I/O
+    '''
     def __init__(
         self, pbar, write_interval=10,
-        output_dir="./", fname="heartbeat.json"
+        output_dir="./", fname="heartbeat.json", background=False
     ):
         self.pbar = pbar
         self.fname = Path(output_dir) / fname
         self.ticker = IntervalTicker(write_interval)
         self.completed = False
+        self.writer = _BackgroundWriter(self.fname) if background else None
 
         # force one write at the beginning
         self.beat(force_write=True, n_stack_up=2)
@@ -50,12 +114,20 @@ class HeartBeat():
             stats = self.stats()
             stats['caller'] = caller_info(n_stack_up)
 
-            with open(self.fname, "w") as f:
-                json.dump(stats, f)
+            if self.writer is not None:
+                self.writer.put(stats)
+            else:
+                write_json_atomic(self.fname, stats)
 
     def done(self):
         self.completed = True
         self.beat(force_write=True, n_stack_up=2)
+        self.close()  # the final beat must be on disk once we return
+
+    def close(self):
+        if self.writer is not None:
+            writer, self.writer = self.writer, None
+            writer.close()
 
     def stats(self):
         pbar = self.pbar
@@ -75,6 +147,7 @@ class HeartBeat():
     def __exit__(self, exc_type, exc_val, exc_tb):
         assert _CURRENT_BEAT_STACK[-1] == self
         _CURRENT_BEAT_STACK.pop()
+        self.close()
 
 
 """
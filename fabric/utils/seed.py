@@ -1,12 +1,12 @@
 import random
 import numpy as np
-import torch
 
 max_seed_value = np.iinfo(np.uint32).max
 min_seed_value = np.iinfo(np.uint32).min
 
 
 def seed_everything(seed=None):
+    import torch  # not importing in global; most callers of fabric never need torch
     seed = int(seed)
 
     if not (min_seed_value <= seed <= max_seed_value):
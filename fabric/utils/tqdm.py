@@ -1,8 +1,8 @@
 import os
-from tqdm import tqdm as orig_tqdm
 
 
 def tqdm(*args, **kwargs):
+    from tqdm import tqdm as orig_tqdm  # deferred; importing tqdm is not free
     is_remote = bool(os.environ.get("IS_REMOTE", False))
     if is_remote:
         f = open(os.devnull, "w")
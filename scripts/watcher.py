@@ -1,4 +1,3 @@
-from fabric.cluster.smit2 import period_watch
 from fabric.cluster.watch import survey
 import click
 
@@ -6,10 +5,15 @@ import click
 @click.command()
 @click.option("-a", "--action")
 @click.option("-i", "--interval", default=5)
-def main(action, interval):
+@click.option(
+    "-b", "--backend", default="postgres", type=click.Choice(["postgres", "sqlite"]),
+    help="survey the jobs on the Postgres server or in the local tracker db"
+)
+def main(action, interval, backend):
     if action == "survey":
-        survey(interval)
+        survey(interval, backend=backend)
     elif action == "update":
+        from fabric.cluster.smit2 import period_watch
         period_watch(interval)
     else:
         raise ValueError(action)
@@ -10,12 +10,14 @@ setup(
     install_requires=[],
     package_data={
         # If any package contains *.yml, include them:
-        '': ['*.yml'],
+        '': ['*.yml', '*.sh'],
     },
     entry_points={
         'console_scripts': [
             'smit=fabric.cluster.smit2:main',
             'sow=fabric.deploy.sow:main',
+            'reap=fabric.deploy.fingerprint:main',
+            'fabric=fabric.cli:main',
             'gvlist=fabric.utils.git:list_subdirs_versions'
         ]
     },
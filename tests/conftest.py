@@ -0,0 +1,18 @@
+import json
+from datetime import datetime
+import pytest
+
+
+def _write_heartbeat(run_dir, beat=None, **info):
+    '''writes run_dir/heartbeat.json; info overrides the fields'''
+    beat = datetime.now() if beat is None else beat
+    hbeat = dict(beat=beat.isoformat(timespec='seconds'), done=False,
+                 meter="5/10 [00:30<00:30,  6.00s/it]", elapsed=30, caller="train.py:10")
+    hbeat.update(info)
+    with open(run_dir / "heartbeat.json", "w") as f:
+        json.dump(hbeat, f)
+
+
+@pytest.fixture
+def write_heartbeat():
+    return _write_heartbeat
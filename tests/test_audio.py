@@ -1,7 +1,12 @@
+import os
 import os.path as osp
+import struct
+import tempfile
 import unittest
+import numpy as np
+import soundfile as sf
 from fvcore.common.benchmark import benchmark
-from fabric.io.audio import load_audio
+from fabric.io.audio import load_audio, AudioReader, stream_audio
 
 fname = '/projects/haochenw/av/audio_visual/j_utah/_hptbEVx5eM.wav'
 
@@ -45,5 +50,144 @@ class LoadingConsistency(unittest.TestCase):
         benchmark(audio_benchmark, 'bm', args, num_iters=4, warmup_iters=1)
 
 
+class MmapLoading(unittest.TestCase):
+    def test_mmap_soundfile_consistency(self):
+        rng = np.random.default_rng(0)
+        samples = rng.uniform(-1, 1, size=(16000 * 4, 2))
+        with tempfile.TemporaryDirectory() as dirname:
+            for subtype in ('PCM_U8', 'PCM_16', 'PCM_32', 'FLOAT'):
+                wav_fname = osp.join(dirname, f'{subtype}.wav')
+                sf.write(wav_fname, samples, 16000, subtype=subtype)
+                for start, end in (
+                    [None, None],
+                    [1.2345, 3.1]
+                ):
+                    sf_data, sr = load_audio(wav_fname, start, end, backend='soundfile')
+                    mm_data, mm_sr = load_audio(
+                        wav_fname, start, end, backend='mmap', dtype='float32'
+                    )
+                    self.assertEqual(sr, mm_sr)
+                    self.assertEqual(sf_data.dtype, mm_data.dtype)
+                    self.assertTrue((sf_data == mm_data).all())
+
+                raw, _ = load_audio(wav_fname, 1, 2, backend='mmap')
+                self.assertIsInstance(raw.base, np.memmap)  # zero-copy
+                self.assertEqual(raw.shape, (2, 16000))
+
+    @unittest.skipIf(not osp.isdir('/proc/self/fd'), 'needs /proc to count fds')
+    def test_mmap_does_not_pin_fds(self):
+        from fabric.io.audio import _wav_header
+        num_files = _wav_header.cache_info().maxsize + 16
+        with tempfile.TemporaryDirectory() as dirname:
+            wav_fname = osp.join(dirname, 'src.wav')
+            sf.write(wav_fname, np.zeros((160, 1)), 16000, subtype='PCM_16')
+            with open(wav_fname, 'rb') as f:
+                payload = f.read()
+            fnames = [osp.join(dirname, f'{i}.wav') for i in range(num_files)]
+            for fname in fnames:
+                with open(fname, 'wb') as f:
+                    f.write(payload)
+
+            num_fds = len(os.listdir('/proc/self/fd'))
+            for fname in fnames:
+                data, _ = load_audio(fname, backend='mmap')
+                self.assertEqual(data.shape, (1, 160))
+            del data
+            self.assertLessEqual(len(os.listdir('/proc/self/fd')), num_fds + 1)
+
+            # a rewritten file is re-parsed rather than served from the cache
+            sf.write(fnames[0], np.zeros((320, 2)), 16000, subtype='PCM_16')
+            os.utime(fnames[0], ns=(1, 1))
+            data, _ = load_audio(fnames[0], backend='mmap')
+            self.assertEqual(data.shape, (2, 320))
+
+    def test_mmap_stops_at_the_data_chunk(self):
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as dirname:
+            wav_fname = osp.join(dirname, 'a.wav')
+            sf.write(wav_fname, rng.uniform(-1, 1, size=(100, 1)), 16000, subtype='PCM_16')
+            # a LIST/INFO tag after the samples, as taggers append it
+            info = b'INFO' + b'INAM' + struct.pack('<I', 18) + b'a tagged recording'
+            with open(wav_fname, 'r+b') as f:
+                f.seek(0, os.SEEK_END)
+                f.write(b'LIST' + struct.pack('<I', len(info)) + info)
+                riff_size = f.tell() - 8
+                f.seek(4)
+                f.write(struct.pack('<I', riff_size))
+
+            sf_data, _ = load_audio(wav_fname, backend='soundfile')
+            mm_data, _ = load_audio(wav_fname, backend='mmap', dtype='float32')
+            self.assertEqual(sf_data.shape, (1, 100))
+            self.assertTrue((sf_data == mm_data).all())
+            chunks = list(stream_audio(wav_fname, 0.002, backend='mmap', dtype='float32'))
+            self.assertEqual(sum(c.shape[1] for _, c in chunks), 100)
+
+
+class WindowedReading(unittest.TestCase):
+    def test_read_windows_matches_load_audio(self):
+        rng = np.random.default_rng(0)
+        windows = [(3.0, 3.5), (0.1, 0.6), (0.3, 0.8), (2.0, 2.5)]
+        with tempfile.TemporaryDirectory() as dirname:
+            wav_fname = osp.join(dirname, 'a.wav')
+            sf.write(wav_fname, rng.uniform(-1, 1, size=(16000 * 4, 2)), 16000)
+            with AudioReader(max_open=1, max_gap_secs=0.5) as reader:
+                data, sr = reader.read_windows(wav_fname, windows)
+                self.assertEqual(data.shape, (len(windows), 2, 8000))
+                for inx, (start, end) in enumerate(windows):
+                    ref, _ = load_audio(wav_fname, start, end)
+                    self.assertTrue((data[inx] == ref).all())
+
+                with self.assertRaises(ValueError):
+                    reader.read_windows(wav_fname, [(0, 1), (0, 2)])
+
+    def test_chained_windows_are_read_in_bounded_spans(self):
+        from fabric.io.audio import _coalesce_windows
+        # every window overlaps the next; one chain across the whole file
+        starts = list(range(0, 10000, 50))
+        spans = list(_coalesce_windows(starts, 100, max_gap=0, max_span=1000))
+        self.assertTrue(all(end - start <= 1000 for start, end, _ in spans))
+        self.assertEqual(sorted(i for _, _, members in spans for i in members), list(range(200)))
+        # a window longer than max_span is still read, on its own
+        self.assertEqual(
+            list(_coalesce_windows([0, 10], 100, max_gap=0, max_span=50)),
+            [(0, 100, [0]), (10, 110, [1])]
+        )
+
+        rng = np.random.default_rng(0)
+        windows = [(t / 10, t / 10 + 0.5) for t in range(35)] + [(3.5, 4.0)]
+        with tempfile.TemporaryDirectory() as dirname:
+            wav_fname = osp.join(dirname, 'a.wav')
+            sf.write(wav_fname, rng.uniform(-1, 1, size=(16000 * 4, 1)), 16000)
+            with AudioReader(max_span_secs=1.0) as reader:
+                data, _ = reader.read_windows(wav_fname, windows)
+            for inx, (start, end) in enumerate(windows):
+                ref, _ = load_audio(wav_fname, start, end)
+                self.assertTrue((data[inx] == ref).all())
+
+
+class StreamReading(unittest.TestCase):
+    def test_stream_chunks_match_load_audio(self):
+        rng = np.random.default_rng(0)
+        with tempfile.TemporaryDirectory() as dirname:
+            wav_fname = osp.join(dirname, 'a.wav')
+            sf.write(wav_fname, rng.uniform(-1, 1, size=(1000, 2)), 100)
+            full, sr = load_audio(wav_fname)
+            for chunk_secs, hop_secs in ([1.0, 0.5], [0.3, 0.5], [1.0, None]):
+                sf_chunks = list(stream_audio(wav_fname, chunk_secs, hop_secs, 0.05, 9.93))
+                mm_chunks = list(stream_audio(
+                    wav_fname, chunk_secs, hop_secs, 0.05, 9.93,
+                    backend='mmap', dtype='float32', prefetch=2
+                ))
+                self.assertEqual(len(sf_chunks), len(mm_chunks))
+                for (sf_t, sf_c), (mm_t, mm_c) in zip(sf_chunks, mm_chunks):
+                    self.assertEqual(sf_t, mm_t)
+                    self.assertTrue((sf_c == mm_c).all())
+                    s = round(sf_t * sr)
+                    self.assertTrue((sf_c == full[:, s:s + sf_c.shape[1]]).all())
+                if hop_secs is None or hop_secs <= chunk_secs:  # no gaps; reaches the end
+                    last_t, last_c = sf_chunks[-1]
+                    self.assertEqual(round(last_t * sr) + last_c.shape[1], 993)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -1,5 +1,7 @@
 from fabric.config import BaseConfig, mkcfg, oneof
+from fabric.thimble import invalidate_field_cache
 from pprint import pp
+from timeit import timeit
 import pytest
 from contextlib import contextmanager
 
@@ -217,3 +219,166 @@ def test_overall():
     print("")
     cfg = ModelConfig()
     print(cfg)
+
+
+def test_compiled_validators():
+    class Cfg(BaseConfig):
+        widths: list[int] = None
+        grid: tuple[list[float]] = None
+        anything: list = None
+
+    x = Cfg(dict(widths=list(range(1000)), grid=([1.0], [2.0, 3.0]), anything=['a', 'b']))
+    assert len(x.widths) == 1000
+
+    with expect_error(AssertionError, 'list member dtype is int; got 3.0 of type float'):
+        Cfg(dict(widths=[1, 2, 3.0]))
+
+    with expect_error(AssertionError, 'list member dtype is int; got True of type bool'):
+        Cfg(dict(widths=[1, True]))  # bool is not int
+
+    with expect_error(AssertionError, 'list member dtype is float'):
+        Cfg(dict(grid=([1.0], [2])))
+
+    with expect_error(AssertionError, 'list member dtype is str'):
+        Cfg(dict(anything=['a', 1]))  # inferred from the first element
+
+    # trusted mode skips the checks altogether
+    x = Cfg(dict(widths=[1, 2, 3.0]), trusted=True)
+    assert x.widths == [1, 2, 3.0]
+
+
+def test_frozen_config():
+    cfg = ModelConfig(dict(input_dim=3, model='LLAMA2Config'))
+    frozen = cfg.freeze()
+    assert_dict_eq(frozen.as_dict(), cfg.as_dict())
+    assert not hasattr(frozen, '__dict__')
+
+    with expect_error(AttributeError, 'immutable'):
+        frozen.lr = 0.5
+
+    # structural hashing and equality
+    assert hash(frozen) == hash(cfg.freeze())
+    assert frozen == cfg.freeze()
+    assert len({frozen, cfg.freeze()}) == 1
+
+    other = frozen.replace(lr=0.5)
+    assert other.lr == 0.5 and frozen.lr == 0.1
+    assert other != frozen
+    assert other.process_fn is frozen.process_fn  # untouched subtrees are shared
+    assert other.replace(lr=0.1) == frozen
+
+    with expect_error(AssertionError, 'dtype mismatch'):
+        frozen.replace(lr=1)
+
+    nested = frozen.replace(process_fn=dict(a=3))
+    assert nested.process_fn.a == 3
+
+    assert_dict_eq(frozen.thaw().as_dict(), cfg.as_dict())
+
+
+def test_frozen_config_lifetime_and_names():
+    import gc
+    import weakref
+    from fabric.thimble import _FROZEN_CLASSES
+
+    class Cfg(BaseConfig):
+        a = 1
+    frozen = Cfg().freeze()
+    assert Cfg in _FROZEN_CLASSES
+    ref = weakref.ref(Cfg)
+    del Cfg
+    gc.collect()
+    assert frozen.thaw().as_dict() == dict(a=1)  # alive while frozen instances are
+    del frozen
+    gc.collect()
+    assert ref() is None and len([c for c in _FROZEN_CLASSES if c is ref()]) == 0
+
+    class Shadowing(BaseConfig):
+        a = 1
+        replace = 2
+    with expect_error(ValueError, "['replace']"):
+        Shadowing().freeze()
+
+
+def test_fingerprint():
+    from fabric.deploy.fingerprint import config_fingerprint
+    cfg = ModelConfig(dict(input_dim=3, model='LLAMA2Config'))
+    fp = cfg.fingerprint()
+    assert fp == cfg.freeze().fingerprint()
+    # spelling out a default, or reordering keys, is the same config
+    assert fp == ModelConfig(dict(model='LLAMA2Config', lr=0.1, input_dim=3)).fingerprint()
+    assert fp == config_fingerprint(dict(model='LLAMA2Config', input_dim=3), schema=ModelConfig)
+    assert fp != cfg.freeze().replace(lr=0.5).fingerprint()
+
+
+def test_field_resolution_cache():
+    class CfgA(BaseConfig):
+        a: int = 3
+
+    class CfgB(CfgA):
+        b = 4.0
+
+    assert CfgB._cached_schema() is CfgB._cached_schema()
+    assert_dict_eq(CfgB().as_dict(), dict(a=3, b=4.0))
+
+    # find_fields hands out a copy; editing it leaves the cache alone
+    CfgB.find_fields().pop('a')
+    assert_dict_eq(CfgB().as_dict(), dict(a=3, b=4.0))
+
+    # patching a parent default after first use must reach the children
+    CfgA.a = 5
+    assert_dict_eq(CfgB().as_dict(), dict(a=5, b=4.0))
+
+    # redefinition is a new class with its own cache
+    class CfgB(CfgA):
+        b = 1.0
+        c = True
+    assert_dict_eq(CfgB().as_dict(), dict(a=5, b=1.0, c=True))
+
+
+def test_schema_cache_hit(monkeypatch):
+    resolved = []
+    resolve = BaseConfig._resolve_fields.__func__
+    monkeypatch.setattr(
+        BaseConfig, '_resolve_fields', classmethod(lambda cls: resolved.append(cls) or resolve(cls))
+    )
+
+    class CfgA(BaseConfig):
+        a = 1
+
+    class CfgB(CfgA):
+        b = 2
+
+    for _ in range(3):
+        ModelConfig()
+        CfgB()
+    assert resolved.count(ModelConfig) == 1 and resolved.count(CfgB) == 1
+
+    # building another config class, or patching an unrelated one, keeps the cache
+    mkcfg(lambda *, x=1: x)
+    CfgB.b = 3
+    ModelConfig()
+    assert resolved.count(ModelConfig) == 1
+
+    # patching a class drops its cache and its children's
+    assert CfgB().as_dict() == dict(a=1, b=3)
+    assert resolved.count(CfgB) == 2
+    CfgA.a = 5
+    assert CfgB().as_dict() == dict(a=5, b=3)
+    assert resolved.count(CfgB) == 3 and resolved.count(ModelConfig) == 1
+
+
+def benchmark_instantiation(num_iters=1000):
+    '''not a test; timings are machine dependent. python tests/test_config.py'''
+    def cold():
+        invalidate_field_cache()
+        ModelConfig()
+
+    uncached = timeit(cold, number=num_iters)
+    cached = timeit(ModelConfig, number=num_iters)
+    print(f"instantiation: {uncached / num_iters * 1e6:.1f}us uncached, "
+          f"{cached / num_iters * 1e6:.1f}us cached, {uncached / cached:.1f}x")
+
+
+if __name__ == "__main__":
+    benchmark_instantiation()
@@ -0,0 +1,263 @@
+import pytest
+import yaml
+import os
+from fabric.deploy.sow import (
+    parse_launch_config, join_parts_into_path, ConfigMaker,
+    plant_cfgs, print_plant_summary, manifest_of, removed_from_manifest, current_paths, dedup_completed,
+    dedup_statuses, main,
+    make_base_maker, diff_exps, diff_from_base, format_diff_table
+)
+from fabric.deploy.fingerprint import ResultIndex, config_fingerprint, find_completed_runs
+
+launch_template = """
+base:
+  arch:
+    option1: net1
+    option2: 0.5
+  option3: 7
+
+base_modify:
+  - option3: 0
+
+particular:
+  - name: e
+    modify:
+      - arch.option2: 1.0
+    expand:
+      - alias: [a1, a2]
+        arch.option1: [net1, net2]
+      - alias: [b1, b2]
+        option3: [1, 6]
+
+  - name: prefix2
+    expand:
+      - alias: [1.1, 2]
+        arch.option2: [0.1, 0.2]
+"""
+
+
+def parse_template():
+    launch_config = yaml.safe_load(launch_template)
+    acc = parse_launch_config(launch_config)
+    acc = {join_parts_into_path(k, None): v for k, v in acc.items()}
+    return launch_config, acc
+
+
+def test_expansion():
+    _, acc = parse_template()
+    assert list(acc.keys()) == [
+        'e_a1_b1', 'e_a1_b2', 'e_a2_b1', 'e_a2_b2', 'prefix2_1.1', 'prefix2_2'
+    ]
+    assert acc['e_a2_b2'].state == {'arch': {'option1': 'net2', 'option2': 1.0}, 'option3': 6}
+    assert acc['prefix2_1.1'].state == {'arch': {'option1': 'net1', 'option2': 0.1}, 'option3': 0}
+    # the override set on top of the base
+    assert acc['prefix2_2'].clauses == [{'option3': 0}, {'arch.option2': 0.2}]
+
+
+def test_sweep_points_share_but_never_leak():
+    launch_config, acc = parse_template()
+    # the base given by the user is never edited in place
+    assert launch_config['base'] == {'arch': {'option1': 'net1', 'option2': 0.5}, 'option3': 7}
+
+    # untouched subtrees are shared rather than copied per point
+    assert acc['e_a1_b1'].state['arch'] is acc['e_a1_b2'].state['arch']
+
+    maker = acc['e_a1_b1'].clone()
+    maker.execute_clause({'arch.option1': 'net3'})
+    assert maker.state['arch']['option1'] == 'net3'
+    assert acc['e_a1_b1'].state['arch']['option1'] == 'net1'
+    assert acc['e_a1_b2'].state['arch']['option1'] == 'net1'
+
+
+def test_typed_overrides():
+    base = {'lr': 0.1, 'flag': False, 'name': 'a', 'widths': [1, 2], 'opt': None}
+    pairs = [
+        ({'lr': '0.5'}, 'lr', 0.5),  # cmdline args are str
+        ({'lr': 0.5}, 'lr', 0.5),  # yaml values are native
+        ({'flag': 'true'}, 'flag', True),  # yaml spelling
+        ({'flag': 'True'}, 'flag', True),  # python spelling
+        ({'name': '1e-3'}, 'name', '1e-3'),  # str fields stay str
+        ({'name': 7}, 'name', '7'),
+        ({'widths': '[4, 8, 16]'}, 'widths', [4, 8, 16]),
+        ({'opt': '{a: 1}'}, 'opt', {'a': 1}),  # unset fields take any type
+    ]
+    for clause, key, expected in pairs:
+        maker = ConfigMaker(base)
+        maker.execute_clause(clause)
+        assert maker.state[key] == expected
+        assert type(maker.state[key]) is type(expected)
+
+    maker = ConfigMaker(base)
+    with pytest.raises(AssertionError, match='require float, given int'):
+        maker.execute_clause({'lr': '1'})
+    with pytest.raises(AssertionError, match='require float, given str'):
+        maker.execute_clause({'lr': "__import__('os').getcwd()"})  # never evaluated
+
+
+def test_diff_from_base():
+    launch_config = yaml.safe_load(launch_template)
+    base_maker = make_base_maker(launch_config)
+    acc = parse_launch_config(launch_config, base_maker)
+    acc = {join_parts_into_path(k, None): v for k, v in acc.items()}
+
+    base, diffs = diff_exps(base_maker.state, acc)
+    assert base == {'arch.option2': 0.5, 'option3': 0, 'arch.option1': 'net1'}
+    assert diffs['e_a1_b1'] == {'arch.option2': 1.0, 'option3': 1}
+    assert diffs['e_a2_b2'] == {'arch.option1': 'net2', 'arch.option2': 1.0, 'option3': 6}
+    assert diffs['prefix2_2'] == {'arch.option2': 0.2}
+
+    # same value but a different type is a change; removed keys are reported
+    assert diff_from_base({'a': 1, 'b': {'c': 2}}, {'a': 1.0, 'b': {}}) == {'a': 1.0, 'b.c': '<unset>'}
+
+    table = format_diff_table(base, diffs).splitlines()
+    assert table[0].split() == ['exp', 'arch.option2', 'option3', 'arch.option1']
+    assert table[3].split() == ['e_a1_b1', '1.0', '1', '.']
+    assert table[-1] == '6 exps; 3 options vary'
+
+
+def test_plant_in_pool(tmp_path, monkeypatch, capsys):
+    monkeypatch.chdir(tmp_path)
+    # flush only what sow wrote; never every file system on the machine
+    monkeypatch.setattr(os, 'sync', lambda: pytest.fail("os.sync() called"))
+    synced = []
+    fsync = os.fsync
+    monkeypatch.setattr(os, 'fsync', lambda fd: synced.append(fd) or fsync(fd))
+
+    _, acc = parse_template()
+    exps = [(name, maker.state) for name, maker in acc.items()]
+    os.makedirs('e_a1_b2/00')
+    with open('e_a1_b2/00/config.yml', 'w') as f:
+        f.write(yaml.safe_dump({'stale': True}))
+
+    planted, statuses = plant_cfgs(exps, overwrite=False, repeat=2, num_workers=4)
+    assert [p for (p, _, _, _) in statuses][:4] == ['e_a1_b1/00', 'e_a1_b1/01', 'e_a1_b2/00', 'e_a1_b2/01']
+    assert planted == [p for (p, _, written, _) in statuses if written]
+    assert len(planted) == 2 * len(exps) - 1  # the stale dup is left alone
+    for name, cfg in exps:
+        assert yaml.safe_load(open(f'{name}/01/config.yml')) == cfg
+    assert yaml.safe_load(open('e_a1_b2/00/config.yml')) == {'stale': True}
+    # once each, after planting: every file, its dir, the exp dirs and the runs folder
+    assert len(synced) == 2 * len(planted) + len(exps) + 1
+
+    planted, statuses = plant_cfgs(exps, overwrite=False, repeat=2, num_workers=4)
+    assert planted == []
+    print_plant_summary(statuses)
+    assert capsys.readouterr().out.splitlines() == [
+        "planted 0 new configs", "dup identical: 11 skipped", "dup differs: 1 skipped",
+        "dups that differ from the configs on disk; --overwrite to replace:",
+        "  e_a1_b2/00",
+    ]
+
+
+def test_incremental_resow(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    _, acc = parse_template()
+    exps = [(name, maker.state) for name, maker in acc.items()]
+
+    planted, statuses = plant_cfgs(exps, overwrite=False, repeat=0)
+    assert planted == list(acc.keys())
+    manifest = manifest_of(statuses)
+
+    # nothing changed: nothing is touched, not even read
+    mtime = os.stat('e_a1_b1/config.yml').st_mtime_ns
+    planted, statuses = plant_cfgs(exps, overwrite=False, repeat=0, manifest=manifest)
+    assert planted == []
+    assert set(status for (_, status, _, _) in statuses) == {'unchanged'}
+    assert os.stat('e_a1_b1/config.yml').st_mtime_ns == mtime
+
+    # one exp edited, one dropped from the launch file
+    edited = ConfigMaker(acc['e_a1_b1'].state)
+    edited.execute_clause({'option3': 100})
+    exps = [('e_a1_b1', edited.state)] + exps[1:-1]
+    planted, statuses = plant_cfgs(exps, overwrite=False, repeat=0, manifest=manifest)
+    assert planted == []  # differing dups need --overwrite
+    assert 'e_a1_b1' not in current_paths(statuses)
+    assert manifest_of(statuses)['e_a1_b1'] == manifest['e_a1_b1']
+    assert removed_from_manifest(manifest, statuses) == ['prefix2_2']
+
+    planted, statuses = plant_cfgs(exps, overwrite=True, repeat=0, manifest=manifest)
+    assert planted == ['e_a1_b1']
+    assert yaml.safe_load(open('e_a1_b1/config.yml'))['option3'] == 100
+    assert current_paths(statuses) == [name for name, _ in exps]
+
+
+def test_dedup_completed_runs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    index_fname = str(tmp_path / 'index.sqlite')
+    _, acc = parse_template()
+    exps = [(name, maker.state) for name, maker in acc.items()]
+
+    # an earlier sweep in another runs folder; one of its runs completed
+    os.makedirs('old')
+    monkeypatch.chdir(tmp_path / 'old')
+    plant_cfgs(exps[:2], overwrite=False, repeat=0)
+    with open('e_a1_b1/heartbeat.json', 'w') as f:
+        f.write('{"done": true}')
+    with open('e_a1_b2/heartbeat.json', 'w') as f:
+        f.write('{"done": false}')
+    monkeypatch.chdir(tmp_path)
+
+    found = list(find_completed_runs(['old']))
+    assert found == [(config_fingerprint(exps[0][1]), 'old/e_a1_b1')]
+    with ResultIndex(index_fname) as index:
+        index.register_many(found)
+
+    # launcher options do not change what a run computes
+    with_smit = dict(exps[0][1], smit='--gres gpu:1')
+    assert config_fingerprint(with_smit) == found[0][0]
+
+    os.makedirs('new')
+    monkeypatch.chdir(tmp_path / 'new')
+    remaining, deduped = dedup_completed(exps, 'symlink', index_fname)
+    assert [name for name, _ in remaining] == list(acc.keys())[1:]
+    assert deduped == [('e_a1_b1', str(tmp_path / 'old' / 'e_a1_b1'))]
+    assert os.path.realpath('e_a1_b1') == str(tmp_path / 'old' / 'e_a1_b1')
+
+    # a deduped exp is still in the launch file; not removed from the manifest
+    manifest = {name: 'digest' for name, _ in exps}
+    _, statuses = plant_cfgs(remaining, overwrite=False, repeat=0)
+    statuses += dedup_statuses(deduped, manifest)
+    assert removed_from_manifest(manifest, statuses) == []
+    assert manifest_of(statuses)['e_a1_b1'] == 'digest'
+    assert 'e_a1_b1' not in current_paths(statuses)
+
+    # re-sown without --dedup: the link is reported, and nothing is planted through it
+    old_cfg = open(tmp_path / 'old' / 'e_a1_b1' / 'config.yml').read()
+    planted, statuses = plant_cfgs(exps, overwrite=True, repeat=0, manifest=manifest)
+    assert statuses[0] == ('e_a1_b1', 'completed elsewhere', False, 'digest')
+    assert 'e_a1_b1' not in planted + current_paths(statuses)
+    assert open(tmp_path / 'old' / 'e_a1_b1' / 'config.yml').read() == old_cfg
+
+    # an earlier, unfinished plant of the exp is kept, planted and listed, not linked
+    os.makedirs(tmp_path / 'unfinished')
+    monkeypatch.chdir(tmp_path / 'unfinished')
+    plant_cfgs(exps[:1], overwrite=False, repeat=0)
+    remaining, deduped = dedup_completed(exps, 'symlink', index_fname)
+    assert [name for name, _ in remaining] == list(acc.keys()) and deduped == []
+    assert not os.path.islink('e_a1_b1')
+    _, statuses = plant_cfgs(remaining, overwrite=False, repeat=0)
+    assert 'e_a1_b1' in current_paths(statuses)
+    monkeypatch.chdir(tmp_path)
+
+    # runs that went away are dropped from the index
+    os.remove(tmp_path / 'old' / 'e_a1_b1' / 'heartbeat.json')
+    assert len(dedup_completed(exps, 'skip', index_fname)[0]) == len(exps)
+    with ResultIndex(index_fname) as index:
+        assert len(index) == 0
+
+
+def test_sow_logs(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    with open('launch.yml', 'w') as f:
+        f.write(launch_template)
+
+    def sow(*extra):
+        monkeypatch.setattr('sys.argv', ['sow', '-f', 'launch.yml', '-k', 't', *extra])
+        main()
+        monkeypatch.chdir(tmp_path)
+        return yaml.safe_load(open('exps_t.yml')), yaml.safe_load(open('exps_t_all.yml'))
+
+    everything = [str(tmp_path / 'runs_t' / name) for name in parse_template()[1]]
+    assert sow() == (everything, everything)
+    # a re-sow that changes nothing leaves nothing for smit to resubmit
+    assert sow() == ([], everything)
@@ -0,0 +1,52 @@
+import io
+import json
+import threading
+import pytest
+from tqdm import tqdm
+from fabric.utils.heartbeat import HeartBeat, caller_info
+
+
+def test_caller_info():
+    def beat():
+        return caller_info(1)
+    assert beat().endswith(f"test_heartbeat.py:{test_caller_info.__code__.co_firstlineno + 3} - test_caller_info")
+
+
+@pytest.mark.parametrize('background', [False, True])
+def test_heartbeat(tmp_path, background):
+    pbar = tqdm(total=10, file=io.StringIO())
+    with HeartBeat(pbar, write_interval=0, output_dir=tmp_path, background=background) as hbeat:
+        for _ in range(10):
+            pbar.update()
+            hbeat.beat(force_write=True)
+        hbeat.done()
+
+    with open(tmp_path / "heartbeat.json") as f:
+        info = json.load(f)
+    assert info['done'] and info['meter'].startswith("10/10")
+    assert "test_heartbeat.py" in info['caller'] and info['caller'].endswith("test_heartbeat")
+    assert [p.name for p in tmp_path.iterdir()] == ["heartbeat.json"]  # no temp files left
+
+
+def test_heartbeat_never_torn(tmp_path):
+    pbar = tqdm(total=1000, file=io.StringIO())
+    hbeat = HeartBeat(pbar, write_interval=0, output_dir=tmp_path)
+    stop = threading.Event()
+    errors = []
+
+    def read():
+        while not stop.is_set():
+            try:
+                with open(tmp_path / "heartbeat.json") as f:
+                    json.load(f)
+            except ValueError as e:
+                errors.append(e)
+
+    reader = threading.Thread(target=read)
+    reader.start()
+    for _ in range(1000):
+        pbar.update()
+        hbeat.beat(force_write=True)
+    stop.set()
+    reader.join()
+    assert errors == []
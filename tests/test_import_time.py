@@ -0,0 +1,45 @@
+import subprocess
+import sys
+import pytest
+
+# the entry points must not pay for the heavy optional dependencies
+HEAVY = (
+    'torch', 'torchaudio', 'torchvision', 'soundfile', 'av', 'PIL', 'cv2',
+    'lmdb', 'tqdm', 'numpy', 'sqlite3',
+)
+
+LIGHT_IMPORTS = [
+    'fabric.config',
+    'fabric.deploy.sow',
+    'fabric.cluster.smit2',
+    'fabric.utils',
+    'fabric.utils.git',
+    'fabric.io',
+]
+
+
+def loaded_modules(module):
+    '''runs `import module` in a fresh interpreter; returns the names in its sys.modules'''
+    proc = subprocess.run(
+        [sys.executable, '-c', f'import sys, {module}; print(*sys.modules)'],
+        capture_output=True, text=True, check=True
+    )
+    return set(proc.stdout.split())
+
+
+@pytest.mark.parametrize('module', LIGHT_IMPORTS)
+def test_no_heavy_imports(module):
+    modules = loaded_modules(module)
+    assert module in modules
+    loaded = [m for m in HEAVY if m in modules]
+    assert loaded == [], f"import {module} loads {loaded}"
+
+
+def test_lazy_attributes():
+    import fabric.utils
+    import fabric.io
+    assert callable(fabric.utils.HeartBeat)
+    assert 'EventStorage' in dir(fabric.utils)
+    assert fabric.io.AudioReader.__module__ == 'fabric.io.audio'
+    with pytest.raises(AttributeError):
+        fabric.io.no_such_thing
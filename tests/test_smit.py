@@ -0,0 +1,284 @@
+import json
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+import yaml
+from fabric.cluster.smit2 import (
+    make_parser, collect_tasks, infer_job_names, group_by_resources,
+    make_array_jobs, make_pack_jobs, write_index, MAX_ARRAY_SIZE, main as smit_main,
+    make_record
+)
+from fabric.cluster.executor import (
+    SlurmExecutor, read_job_state, update_job_state, compress_array_ids
+)
+from fabric.cluster.pack_runner import (
+    ResourcePool, LocalTask, run_local_tasks, cancel_local_tasks
+)
+
+
+def make_task_dirs(root, smit_overrides):
+    dirs = []
+    for i, smit in enumerate(smit_overrides):
+        d = root / f"exp_{i}"
+        d.mkdir()
+        cfg = {'lr': 0.1} if smit is None else {'lr': 0.1, 'smit': smit}
+        with (d / "config.yml").open("w") as f:
+            yaml.safe_dump(cfg, f)
+        dirs.append(str(d))
+    return dirs
+
+
+def parse_tasks(argv, task_dirs):
+    parser, parser_no_default = make_parser()
+    args, unknown = parser.parse_known_args(argv)
+    if args.num_cpus == 0:
+        args.num_cpus = args.num_gpus * 2
+    names = infer_job_names(task_dirs, args.nj)
+    return collect_tasks(task_dirs, names, args, unknown, parser_no_default)
+
+
+def test_group_by_resources(tmp_path):
+    task_dirs = make_task_dirs(tmp_path, [None, None, '-G 2', None, '-G 2', '--time 1:00:00'])
+    tasks = parse_tasks(['-G', '1', '-j', 'python run.py'], task_dirs)
+    groups = group_by_resources(tasks)
+    assert [[t.name for t in g] for g in groups] == [
+        ['exp_0', 'exp_1', 'exp_3'], ['exp_2', 'exp_4'], ['exp_5']
+    ]
+    assert groups[1][0].args.num_gpus == 2
+    assert groups[2][0].unknown == ['--time', '1:00:00']
+
+
+def test_array_jobs_are_chunked(tmp_path):
+    task_dirs = make_task_dirs(tmp_path, [None] * 3)
+    tasks = parse_tasks(['-j', 'true'], task_dirs)
+    tasks = tasks * (MAX_ARRAY_SIZE // 2)  # 1500 tasks
+    arrays = make_array_jobs(tasks, tmp_path / ".smit", throttle=50)
+    assert [len(a.tasks) for a in arrays] == [MAX_ARRAY_SIZE, MAX_ARRAY_SIZE // 2]
+    assert f"#SBATCH --array=0-{MAX_ARRAY_SIZE - 1}%50" in arrays[0].sbatch
+    assert f"#SBATCH --array=0-{MAX_ARRAY_SIZE // 2 - 1}%50" in arrays[1].sbatch
+
+
+
+def test_sweeps_sharing_a_dir_keep_their_own_state(tmp_path):
+    # e.g. `for k in a b; do smit -f exps_$k.yml --array; done`, within one second
+    task_dirs = make_task_dirs(tmp_path, [None] * 2)
+    tasks = parse_tasks(['-j', 'true'], task_dirs)
+    [first] = make_array_jobs(tasks[:1], tmp_path / ".smit")
+    [second] = make_array_jobs(tasks[1:], tmp_path / ".smit")
+    assert first.index_fname != second.index_fname
+    first, second = (make_pack_jobs(tasks, tmp_path / ".smit", pack_size=2) for _ in range(2))
+    assert first[0].index_fname != second[0].index_fname
+
+    def submit(k):
+        for i in range(20):
+            update_job_state(tmp_path / ".smit", {f"{k}/{i}": str(i)})
+
+    threads = [threading.Thread(target=submit, args=(k, )) for k in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(read_job_state(tmp_path / ".smit")) == 80
+
+def test_array_script_runs_its_task(tmp_path):
+    task_dirs = make_task_dirs(tmp_path, [None, None, None])
+    tasks = parse_tasks(['-j', 'pwd > where.txt; echo job output'], task_dirs)
+    [array_job] = make_array_jobs(tasks, tmp_path / ".smit")
+    write_index(array_job)
+
+    # the #SBATCH lines are comments to bash; play the part of array task 1
+    env = dict(os.environ, SLURM_ARRAY_TASK_ID='1', SLURM_ARRAY_JOB_ID='77')
+    subprocess.run(['bash', '-c', array_job.sbatch], env=env, check=True, cwd=tmp_path)
+
+    task_dir = Path(task_dirs[1])
+    assert (task_dir / "where.txt").read_text().strip() == str(task_dir.resolve())
+    log = (task_dir / "slurm.out").read_text()
+    assert "SLURM ARRAY TASK: 77 1" in log and "job output" in log
+    assert not (Path(task_dirs[0]) / "where.txt").exists()
+
+
+def test_resource_pool():
+    pool = ResourcePool(['0', '1', '2'], num_cpus=4)
+    assert pool.try_acquire(2, 2) == ['0', '1']
+    assert pool.try_acquire(2, 1) is None  # one gpu left
+    assert pool.try_acquire(1, 3) is None  # two cpus left
+    assert pool.try_acquire(1, 2) == ['2']
+    pool.release(['0', '1'], 2)
+    assert pool.try_acquire(0, 2) == []
+    assert not pool.fits(4, 1)
+
+
+def test_run_local_tasks(tmp_path):
+    task_dirs = [Path(d) for d in make_task_dirs(tmp_path, [None] * 5)]
+    cmd = 'echo $CUDA_VISIBLE_DEVICES > gpu.txt; [ "$(basename $PWD)" != exp_3 ]'
+    tasks = [LocalTask(d, cmd, num_gpus=1, num_cpus=1) for d in task_dirs]
+    events = []
+    returncodes = run_local_tasks(
+        tasks, ResourcePool(['0', '1'], num_cpus=2), poll_interval=0.01,
+        on_event=lambda event, task: events.append(event)
+    )
+    assert [returncodes[d] for d in task_dirs] == [0, 0, 0, 1, 0]
+    assert events.count('start') == events.count('done') == 5
+    for d in task_dirs:
+        assert (d / "gpu.txt").read_text().strip() in ('0', '1')  # one gpu each
+        status = json.loads((d / "exit_status.json").read_text())
+        assert status['returncode'] == returncodes[d] and len(status['gpus']) == 1
+
+
+def test_pack_script_runs_its_tasks(tmp_path):
+    task_dirs = make_task_dirs(tmp_path, [None] * 5)
+    tasks = parse_tasks(['-G', '1', '-c', '1', '-j', 'echo $CUDA_VISIBLE_DEVICES > gpu.txt'], task_dirs)
+    packs = make_pack_jobs(tasks, tmp_path / ".smit", pack_size=3, slots=2)
+    assert [len(p.tasks) for p in packs] == [3, 2]
+    assert "#SBATCH -G 2" in packs[0].sbatch and "#SBATCH -c 2" in packs[0].sbatch
+
+    # stand in for slurm: run the sbatch script in a 2 gpu "allocation"
+    repo_root = Path(__file__).resolve().parents[1]
+    env = dict(os.environ, CUDA_VISIBLE_DEVICES='4,5', PYTHONPATH=str(repo_root))
+    for p in packs:
+        write_index(p)
+        subprocess.run(['bash', '-c', p.sbatch], env=env, check=True, cwd=tmp_path)
+
+    for d in map(Path, task_dirs):
+        assert (d / "gpu.txt").read_text().strip() in ('4', '5')
+        assert json.loads((d / "exit_status.json").read_text())['returncode'] == 0
+        assert "CUDA_VISIBLE_DEVICES=" in (d / "slurm.out").read_text()
+
+
+def run_smit(argv, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['smit'] + argv)
+    smit_main()
+
+
+
+def test_empty_exps_file_is_a_no_op(tmp_path, monkeypatch, capsys):
+    # what sow writes to exps_{k}.yml when a re-sow changed nothing
+    (tmp_path / "exps.yml").write_text("[]\n")
+    for extra in ([], ['-m'], ['-a', 'cancel']):
+        run_smit(['-f', str(tmp_path / "exps.yml"), '-j', 'true'] + extra, monkeypatch)
+        assert "nothing to submit" in capsys.readouterr().out
+    assert not (tmp_path / ".smit").exists()
+
+def test_local_backend(tmp_path, monkeypatch, capsys):
+    task_dirs = make_task_dirs(tmp_path, [None, None, '-c 2', None])
+    with (tmp_path / "exps.yml").open("w") as f:
+        yaml.safe_dump(task_dirs, f)
+    run_smit([
+        '-f', str(tmp_path / "exps.yml"), '-j', 'pwd > where.txt',
+        '--backend', 'local', '--local-gpus', '0', '--local-cpus', '2'
+    ], monkeypatch)
+    assert "4 / 4 tasks succeeded" in capsys.readouterr().out
+    for d in map(Path, task_dirs):
+        assert (d / "where.txt").read_text().strip() == str(d)
+        assert "SLURM NODENAME" in (d / "slurm.out").read_text()  # the rendered sbatch script ran
+
+
+def test_local_cancel(tmp_path):
+    task_dirs = [Path(d) for d in make_task_dirs(tmp_path, [None] * 3)]
+    tasks = [LocalTask(d, 'sleep 30', num_cpus=1) for d in task_dirs]
+    result = {}
+    runner = threading.Thread(target=lambda: result.update(
+        run_local_tasks(tasks, ResourcePool([], num_cpus=2), poll_interval=0.01)
+    ))
+    runner.start()
+    while not all((d / "task.pid").exists() for d in task_dirs[:2]):
+        time.sleep(0.01)
+    # two running tasks are signalled, the queued one is marked and skipped
+    assert cancel_local_tasks(task_dirs) == 2
+    runner.join(timeout=10)
+    assert not runner.is_alive()
+    assert [result[d] for d in task_dirs] == [-signal.SIGTERM, -signal.SIGTERM, None]
+    assert not any((d / "task.pid").exists() or (d / "cancel").exists() for d in task_dirs)
+
+
+FAKE_SBATCH = """#!/usr/bin/env bash
+# each script times out once, like a busy slurmctld, and goes through on the retry
+exec 9>> {state}.lock && flock 9  # calls come from several threads
+seen={state}.$(md5sum < "$1" | cut -c1-16)
+if [ ! -e $seen ]; then
+    touch $seen
+    echo "sbatch: error: Batch job submission failed: Socket timed out on send/recv operation" >&2
+    exit 1
+fi
+grep -q FAIL "$1" && {{ echo "sbatch: error: invalid partition" >&2; exit 1; }}
+n=$(cat {state} 2>/dev/null || echo 0); echo $((n + 1)) > {state}
+echo "Submitted batch job $((1001 + n))"
+"""
+
+
+def install_fake_slurm(tmp_path, monkeypatch):
+    bin_dir = tmp_path / "bin"
+    bin_dir.mkdir()
+    sbatch = bin_dir / "sbatch"
+    sbatch.write_text(FAKE_SBATCH.format(state=tmp_path / "sbatch_calls"))
+    scancel = bin_dir / "scancel"
+    scancel.write_text(f'#!/usr/bin/env bash\nprintf "%s\\n" "$*" >> {tmp_path / "scancel_calls"}\n')
+    for f in (sbatch, scancel):
+        f.chmod(0o755)
+    monkeypatch.setenv("PATH", f"{bin_dir}{os.pathsep}{os.environ['PATH']}")
+
+
+def test_concurrent_submission_with_retries(tmp_path, monkeypatch, capsys):
+    install_fake_slurm(tmp_path, monkeypatch)
+    task_dirs = make_task_dirs(tmp_path, [None] * 4 + ['-p FAIL'])
+    tasks = parse_tasks(['-j', 'true'], task_dirs)
+
+    executor = SlurmExecutor(tmp_path / ".smit", num_workers=3, rate=0, backoff_secs=0.01)
+    for t in tasks:
+        executor.submit(make_record(t.name, t.path, t.args, t.unknown).sbatch, [t])
+    assert executor.finish() == 1  # the bad partition is not retried
+
+    out = capsys.readouterr().out
+    assert "4 tasks submitted, 1 failed" in out and "invalid partition" in out
+    state = read_job_state(tmp_path / ".smit")
+    assert sorted(state.keys()) == sorted(str(Path(d).resolve()) for d in task_dirs[:4])
+    assert len(set(state.values())) == 4 and all(v.isdigit() for v in state.values())
+
+
+def test_array_job_ids_are_recorded_per_task(tmp_path, monkeypatch):
+    install_fake_slurm(tmp_path, monkeypatch)
+    task_dirs = make_task_dirs(tmp_path, [None] * 3)
+    tasks = parse_tasks(['-j', 'true'], task_dirs)
+    [array_job] = make_array_jobs(tasks, tmp_path / ".smit")
+
+    executor = SlurmExecutor(tmp_path / ".smit", rate=0, backoff_secs=0.01)
+    executor.submit(array_job.sbatch, array_job.tasks, array=True)
+    assert executor.finish() == 0
+    state = read_job_state(tmp_path / ".smit")
+    assert [state[str(Path(d).resolve())] for d in task_dirs] == ['1001_0', '1001_1', '1001_2']
+
+
+def test_batched_cancel(tmp_path, monkeypatch):
+    install_fake_slurm(tmp_path, monkeypatch)
+    state_dir = tmp_path / ".smit"
+    task_dirs = make_task_dirs(tmp_path, [None] * 6)
+    tasks = parse_tasks(['-j', 'true'], task_dirs)
+    [array_job] = make_array_jobs(tasks[:3], state_dir)
+
+    executor = SlurmExecutor(state_dir, rate=0, backoff_secs=0.01)
+    executor.submit(array_job.sbatch, array_job.tasks, array=True)
+    for t in tasks[3:5]:  # tasks[5] was never submitted through smit
+        executor.submit(make_record(t.name, t.path, t.args, t.unknown).sbatch, [t])
+    executor.finish()
+    state = read_job_state(state_dir)
+    array_id = state[str(Path(task_dirs[0]).resolve())].split('_')[0]
+
+    # part of an array is cancelled task by task
+    SlurmExecutor(state_dir).cancel(tasks[1:2])
+    # the whole rest of the sweep goes out in one call by id, one by name
+    SlurmExecutor(state_dir).cancel(tasks)
+    calls = (tmp_path / "scancel_calls").read_text().splitlines()
+    assert calls[0] == f"{array_id}_1"
+    assert sorted(calls[1].split()) == sorted(
+        [array_id] + [state[str(Path(d).resolve())] for d in task_dirs[3:5]]
+    )
+    assert calls[2] == f"-n {tasks[5].name}"
+
+
+def test_compress_array_ids():
+    submitted = ['7_0', '7_1', '7_2', '8', '9_0', '9_1']
+    assert compress_array_ids(['7_2', '7_0', '7_1', '8', '9_1'], submitted) == ['7', '8', '9_1']
@@ -0,0 +1,73 @@
+import os
+from datetime import datetime, timedelta
+from fabric import yaml_write
+from fabric.cluster.status import (
+    SweepStatus, parse_meter, status_rows, format_status_table, main,
+    RUNNING, STALLED, DONE, NOT_STARTED
+)
+
+
+def test_parse_meter():
+    assert parse_meter("5/10 [00:30<00:30,  6.00s/it]") == ("5/10", "00:30")
+    assert parse_meter("0/10 [00:00<?, ?it/s]") == ("0/10", None)
+    assert parse_meter("123it [00:10, 12.3it/s]") == (None, None)  # no total, no eta
+    assert parse_meter("") == (None, None)
+
+
+def test_sweep_status(tmp_path, capsys, write_heartbeat):
+    run_dirs = []
+    for i in range(4):
+        d = tmp_path / "runs" / f"exp_{i}"
+        d.mkdir(parents=True)
+        run_dirs.append(d)
+    exps_fname = tmp_path / "exps_run.yml"
+    yaml_write(exps_fname, [str(d) for d in run_dirs])
+
+    now = datetime.now()
+    write_heartbeat(run_dirs[0], now)
+    write_heartbeat(run_dirs[1], now - timedelta(hours=1))
+    write_heartbeat(run_dirs[2], now, done=True, meter="10/10 [01:00<00:00,  6.00s/it]")
+    # exp_3 never started
+
+    sweep = SweepStatus(exps_fname)
+    rows = {r['run']: r for r in status_rows(sweep.refresh(), now, stall_secs=600)}
+    assert {k: r['status'] for k, r in rows.items()} == {
+        'exp_0': RUNNING, 'exp_1': STALLED, 'exp_2': DONE, 'exp_3': NOT_STARTED
+    }
+    assert rows['exp_0']['eta'] == "00:30" and rows['exp_1']['eta'] is None
+    assert rows['exp_2']['progress'] == "10/10"
+
+    table = format_status_table(list(rows.values()), now, color=False)
+    assert table.splitlines()[-1] == "4 runs: 1 stalled, 1 running, 1 not started, 1 done"
+
+    write_heartbeat(run_dirs[1], now, meter="9/10 [00:54<00:06,  6.00s/it]")
+    os.utime(run_dirs[1] / "heartbeat.json", ns=(1, 1))  # any mtime change counts
+    rows = {r['run']: r for r in status_rows(sweep.refresh(), now, stall_secs=600)}
+    assert rows['exp_1']['status'] == RUNNING and rows['exp_1']['progress'] == "9/10"
+    # nothing changed since; nothing is read again
+    assert sweep.reader.read_changed([str(d / "heartbeat.json") for d in run_dirs]) == {}
+
+    main([str(exps_fname), '--show', 'running'])
+    out = capsys.readouterr().out
+    assert "exp_0" in out and "exp_1" in out and "exp_2" not in out
+
+
+def test_sweep_status_names_and_deleted_beats(tmp_path, write_heartbeat):
+    # repeats of one exp share the last path segment; the names keep what differs
+    run_dirs = [tmp_path / "runs" / exp / rep for exp in ("a", "b") for rep in ("00", "01")]
+    for d in run_dirs:
+        d.mkdir(parents=True)
+    exps_fname = tmp_path / "exps_run_all.yml"
+    yaml_write(exps_fname, [str(d) for d in run_dirs])
+
+    now = datetime.now()
+    write_heartbeat(run_dirs[0], now)
+    sweep = SweepStatus(exps_fname)
+    rows = {r['run']: r['status'] for r in status_rows(sweep.refresh(), now, stall_secs=600)}
+    assert rows == {'a/00': RUNNING, 'a/01': NOT_STARTED, 'b/00': NOT_STARTED, 'b/01': NOT_STARTED}
+
+    # a restarted run removes its heartbeat; the old one must not linger
+    os.remove(run_dirs[0] / "heartbeat.json")
+    rows = {r['run']: r['status'] for r in status_rows(sweep.refresh(), now, stall_secs=600)}
+    assert rows['a/00'] == NOT_STARTED
+    assert sweep.beats == {}
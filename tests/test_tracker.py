@@ -0,0 +1,38 @@
+import os
+from fabric.cluster.smit2 import Record
+from fabric.cluster.tracker import LocalTracker
+
+
+def test_local_tracker(tmp_path, write_heartbeat):
+    run_dirs = []
+    for i in range(4):
+        d = tmp_path / f"exp_{i}"
+        d.mkdir()
+        run_dirs.append(d)
+    tracker = LocalTracker(str(tmp_path / "tracker.sqlite"))
+    tracker.insert([Record(name=d.name, todo=0, path=str(d)) for d in run_dirs])
+    tracker.commit()
+    assert tracker.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+
+    # no heartbeat yet for exp_3
+    for d in run_dirs[:3]:
+        write_heartbeat(d)
+    assert tracker.sweep() == (3, 0)
+    assert tracker.sweep() == (0, 0)  # nothing changed; nothing read
+
+    write_heartbeat(run_dirs[0], meter="5/10", elapsed=30)
+    write_heartbeat(run_dirs[1], done=True, meter="10/10")
+    os.utime(run_dirs[1] / "heartbeat.json", ns=(1, 1))  # mtime going backwards still counts
+    assert tracker.sweep() == (2, 1)
+
+    jobs = {r.name: r for r in tracker.get_all_jobs()}
+    assert sorted(jobs) == ['exp_0', 'exp_2', 'exp_3']
+    assert jobs['exp_0'].meter == "5/10" and jobs['exp_0'].elapsed == 30
+    [done] = tracker.get_all_jobs("done")
+    assert done.name == 'exp_1' and done.meter == "10/10"
+
+    # resubmission replaces the row rather than clashing on the name
+    tracker.insert([Record(name='exp_0', todo=0, path=str(run_dirs[0]), sbatch="new")])
+    jobs = {r.name: r for r in tracker.get_all_jobs()}
+    assert len(jobs) == 3 and jobs['exp_0'].sbatch == "new" and jobs['exp_0'].meter == ""
+    tracker.close()
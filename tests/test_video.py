@@ -1,6 +1,10 @@
 import unittest
 import os.path as osp
+import tempfile
 import numpy as np
+import av
+import soundfile as sf
+from fvcore.common.benchmark import benchmark
 
 from fabric.io.video import Video
 from torchvision.io import read_video
@@ -66,11 +70,186 @@ class VideoLoading(unittest.TestCase):
             ):
                 deposits = []
                 for _ in range(num_trials):
-                    data = v.load_audio_frames(start, end)
+                    data, _ = v.load_audio_frames(start, end)
                     deposits.append(data)
                 data = np.stack(deposits, axis=0)
                 self.assertTrue((data == data[0]).all())
 
+    def test_audio_load_speed(self):
+        args = [
+            {'route': 'transcode', 'start': 73.5, 'end': 77.7},
+            {'route': 'transcode', 'start': 1000, 'end': 1010.3},
+            {'route': 'container', 'start': 73.5, 'end': 77.7},
+            {'route': 'container', 'start': 1000, 'end': 1010.3},
+        ]
+        benchmark(audio_route_benchmark, 'bm', args, num_iters=4, warmup_iters=1)
+
+
+def audio_route_benchmark(route, start, end):
+    v = Video(fname)
+
+    def func():
+        with v.open_video():
+            if route == 'transcode':
+                return v._load_audio_from_transcode(start, end)
+            else:
+                return v._load_audio_from_container(start, end)
+    return func
+
+
+def write_pcm_clip(dirname, sr=16000, num_secs=3.0):
+    '''a pcm .mov with a sidecar .wav of the very same samples'''
+    rng = np.random.default_rng(0)
+    samples = rng.integers(-2**15, 2**15, size=(int(sr * num_secs), 2), dtype=np.int16)
+    mov_fname = osp.join(dirname, 'clip.mov')
+    sf.write(osp.join(dirname, 'clip.wav'), samples, sr, subtype='PCM_16')
+
+    container = av.open(mov_fname, 'w')
+    stream = container.add_stream('pcm_s16le', rate=sr)
+    stream.layout = 'stereo'
+    step = 1000
+    for i in range(0, len(samples), step):
+        frame = av.AudioFrame.from_ndarray(
+            samples[i:i + step].reshape(1, -1), format='s16', layout='stereo'
+        )
+        frame.sample_rate = sr
+        frame.pts = i
+        for packet in stream.encode(frame):
+            container.mux(packet)
+    for packet in stream.encode(None):
+        container.mux(packet)
+    container.close()
+    return mov_fname
+
+
+def write_video_clip(dirname, name='clip', num_frames=48, fps=24, size=(96, 64)):
+    '''an h264 .mp4 of moving noise with a keyframe every 12 frames'''
+    rng = np.random.default_rng(0)
+    mp4_fname = osp.join(dirname, f'{name}.mp4')
+    container = av.open(mp4_fname, 'w')
+    stream = container.add_stream('libx264', rate=fps)
+    stream.width, stream.height = size
+    stream.pix_fmt = 'yuv420p'
+    stream.codec_context.gop_size = 12
+    for _ in range(num_frames):
+        img = rng.integers(0, 256, size=(size[1], size[0], 3), dtype=np.uint8)
+        for packet in stream.encode(av.VideoFrame.from_ndarray(img, format='rgb24')):
+            container.mux(packet)
+    for packet in stream.encode(None):
+        container.mux(packet)
+    container.close()
+    return mp4_fname
+
+
+class KeyFrameDumping(unittest.TestCase):
+    def test_dump_key_frames_to_lmdb(self):
+        from fabric.io.video import dump_key_frames_to_lmdb
+        from fabric.io.lmdb_tools import ImageLMDB
+        with tempfile.TemporaryDirectory() as dirname:
+            fnames = [write_video_clip(dirname, name) for name in ('a', 'b', 'c')]
+            bad_fname = osp.join(dirname, 'bad.mp4')
+            with open(bad_fname, 'wb') as f:
+                f.write(b'not a video')
+            db_fname = osp.join(dirname, 'frames.lmdb')
+            dump_key_frames_to_lmdb(
+                fnames + [bad_fname], db_fname, num_frames=4, max_side=48, num_workers=2
+            )
+
+            db = ImageLMDB(db_fname)
+            keys = [f'{k}/{i}' for k in ('a', 'b', 'c') for i in range(4)]
+            self.assertEqual([k.decode() for k in db.keys()], keys)  # the bad one is skipped
+            self.assertEqual(len(db), 12)
+            for k in keys:
+                img = np.asarray(db[k])
+                self.assertEqual(img.shape, (32, 48, 3))
+                self.assertEqual(img.dtype, np.uint8)
+
+    def test_grab_key_frames(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            v = Video(write_video_clip(dirname))
+            with v.open_video():
+                frames = v.grab_key_frames(8)
+                # keyframes sit at 0s, 0.5s, 1s and 1.5s; the 8 time points share them
+                self.assertEqual(len(frames), 8)
+                self.assertTrue((frames[0] == frames[1]).all())
+                self.assertFalse((frames[1] == frames[2]).all())
+                self.assertEqual(frames[0].shape, (64, 96, 3))
+                # the skip setting does not leak into later full decodes
+                self.assertEqual(len(v.load_image_frames(0, 1)), 25)
+
+
+class GCPolicyTest(unittest.TestCase):
+    def steps(self, policy, rss_values=None):
+        from unittest import mock
+        rss_values = iter(rss_values or [])
+        with mock.patch('fabric.io.video._rss_mb', side_effect=lambda: next(rss_values)):
+            for _ in range(10 if policy.mode != 'memory' else 5):
+                policy.step()
+        return policy.stats()
+
+    def test_modes(self):
+        from fabric.io.video import GCPolicy
+        self.assertEqual(self.steps(GCPolicy('never'))['num_collections'], 0)
+        self.assertEqual(self.steps(GCPolicy('off'))['num_collections'], 0)
+        self.assertEqual(self.steps(GCPolicy('always'))['num_collections'], 10)
+        self.assertEqual(self.steps(GCPolicy('interval', interval=3))['num_collections'], 3)
+        with self.assertRaises(ValueError):
+            GCPolicy('sometimes')
+
+        collected = []
+        policy = GCPolicy('memory', mem_threshold_mb=500, hook=lambda *a: collected.append(a))
+        # rss per read: the first read sets the baseline; after a collection
+        # the rss is read once more to re-arm
+        stats = self.steps(policy, [100, 300, 700, 650, 900, 1300, 1200])
+        self.assertEqual(stats['calls'], 5)
+        self.assertEqual(stats['num_collections'], 2)
+        self.assertEqual(len(collected), 2)
+        self.assertGreaterEqual(stats['collection_secs'], 0)
+
+    def test_policy_consulted_on_every_read(self):
+        from fabric.io import video
+        prev = video.get_gc_policy()
+        policy = video.set_gc_policy('interval', interval=10 ** 6)
+        try:
+            with tempfile.TemporaryDirectory() as dirname:
+                v = Video(write_video_clip(dirname))
+                with v.open_video():
+                    v.load_image_frames(0, 1)
+                    v.grab_video_key_frame(0.5, 0.5)
+                    v.grab_key_frames(4)
+                self.assertEqual(policy.calls, 6)
+                a = Video(write_pcm_clip(dirname))
+                with a.open_video():
+                    a.load_audio_frames(0.5, 1.0)
+                self.assertEqual(policy.calls, 7)
+        finally:
+            video._GC_POLICY = prev
+
+
+class ContainerAudioLoading(unittest.TestCase):
+    def test_container_matches_transcode(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            v = Video(write_pcm_clip(dirname))
+            with v.open_video():
+                for start, end in (
+                    [None, None],
+                    [0.5, 1.25],
+                    [1.0013, 2.9871]
+                ):
+                    ref, ref_sr = v._load_audio_from_transcode(start, end)
+                    data, sr = v._load_audio_from_container(start, end)
+                    self.assertEqual(sr, ref_sr)
+                    self.assertEqual(data.dtype, np.float32)
+                    self.assertTrue((data == ref).all())
+
+    def test_resample_and_downmix(self):
+        with tempfile.TemporaryDirectory() as dirname:
+            v = Video(write_pcm_clip(dirname))
+            with v.open_video():
+                data, sr = v.load_audio_frames(0.5, 1.25, sampling_rate=8000, num_channels=1)
+        self.assertEqual(sr, 8000)
+        self.assertEqual(data.shape, (1, 6000))
+
 
 if __name__ == "__main__":
     unittest.main()
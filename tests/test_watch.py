@@ -0,0 +1,53 @@
+import sqlite3
+import pytest
+
+pytest.importorskip("pydantic")
+
+from fabric.cluster.tracker import open_local_db
+from fabric.cluster.watch import ConnWrapper, Record, quote_ident
+
+
+def test_conn_wrapper_bulk(tmp_path):
+    # the tracker's tables have the postgres layout: an id, then the Record fields
+    conn = ConnWrapper(open_local_db(str(tmp_path / "jobs.sqlite")))
+    records = [Record(name=f"exp_{i}", todo=0, path=f"/runs/exp_{i}") for i in range(5)]
+    conn.insert_many(records)
+    conn.commit()
+    assert [r.name for r in conn.get_all_jobs()] == [r.name for r in records]
+
+    conn.update_many([
+        ("exp_0", {"meter": "5/10", "elapsed": 30}),
+        ("exp_1", {"meter": "7/10", "elapsed": 40}),
+        ("exp_2", {"done": True}),
+    ])
+    conn.update("exp_3", "beat", "now")
+    resubmitted = Record(name="exp_4", todo=1, path="/runs/exp_4", sbatch="new")
+    conn.upsert_many([resubmitted, Record(name="exp_5", todo=0)])
+    conn.commit()
+
+    jobs = {r.name: r for r in conn.get_all_jobs()}
+    assert sorted(jobs) == [f"exp_{i}" for i in range(6)]
+    assert (jobs["exp_0"].meter, jobs["exp_0"].elapsed) == ("5/10", 30)
+    assert (jobs["exp_1"].meter, jobs["exp_1"].elapsed) == ("7/10", 40)
+    assert jobs["exp_2"].done and jobs["exp_3"].beat == "now"
+    assert jobs["exp_4"] == resubmitted
+
+    finished = [r for r in jobs.values() if r.done]
+    conn.insert_many(finished, "done")
+    conn.delete_many([r.name for r in finished])
+    conn.commit()
+    assert "exp_2" not in {r.name for r in conn.get_all_jobs()}
+    assert conn.conn.execute('SELECT "name" FROM "done"').fetchall() == [("exp_2", )]
+
+    with pytest.raises(sqlite3.IntegrityError):
+        conn.insert_many([Record(name="exp_0", todo=0)])  # plain insert keeps names unique
+
+
+def test_quote_ident():
+    assert quote_ident("jobs") == '"jobs"'
+    assert quote_ident('a"; DROP TABLE jobs; --') == '"a""; DROP TABLE jobs; --"'
+    conn = sqlite3.connect(":memory:")
+    table = 'we"ird'
+    conn.execute(f'CREATE TABLE {quote_ident(table)} ({quote_ident("na me")} TEXT)')
+    ConnWrapper(conn).insert_many([{"na me": "x"}], table)
+    assert conn.execute('SELECT * FROM "we""ird"').fetchall() == [("x", )]